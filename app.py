@@ -1,14 +1,20 @@
+import hmac
 import os
+import threading
 from dotenv import load_dotenv
 import random
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, request
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, request, Response, stream_with_context
 from database import (
     init_db, create_user, verify_user, get_user_by_id,
     add_prediction, get_user_predictions, get_sentiment_stats,
-    add_tracker_history, get_tracker_history
+    add_tracker_history, get_tracker_history, search_comment_predictions,
+    get_batch_job
 )
-from services import gemini_chat
-from services.youtube import analyze_youtube_comments, extract_video_id
+from services import gemini_chat, hate_classifier
+from services.youtube import analyze_youtube_comments, api_error_status, extract_video_id, iter_comment_predictions
+from services.export import export_predictions
+from services.governor import analysis_governor, AdmissionRejected
+from services import batch, prewarm
 from services.views import views
 from services.youtube_tracker import track_video_stats
 
@@ -17,8 +23,31 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.environ.get('SESSION_SECRET', 'dev-secret-key-change-in-production')
 app.register_blueprint(views, url_prefix='/')
-os.makedirs('instance', exist_ok=True)
-init_db()
+
+# The schema is created on the first request rather than at import time.
+_db_ready = False
+_db_lock = threading.Lock()
+
+@app.before_request
+def ensure_db():
+    global _db_ready
+    # Probes must answer without touching the database.
+    if _db_ready or request.endpoint in ('healthz', 'readyz'):
+        return
+    with _db_lock:
+        if not _db_ready:
+            os.makedirs('instance', exist_ok=True)
+            init_db()
+            _db_ready = True
+
+# Optionally load the classifier and run one dummy inference in the
+# background at startup. Otherwise the first /readyz probe starts it.
+if os.environ.get('WARMUP_MODEL', '0') == '1':
+    hate_classifier.start_warm_up()
+
+# Keep analyses of the most-requested videos fresh in the background.
+if prewarm.PREWARM_ENABLED:
+    prewarm.start_background()
 
 
 
@@ -121,11 +150,26 @@ def predict():
             flash('Please enter a valid YouTube video ID or URL', 'error')
             return render_template('predict.html')
 
-        try:
-            analysis_results = analyze_youtube_comments(video_id)
-        except ConnectionError as e:
-            flash(str(e), 'error')
-            return redirect(url_for('predict'))
+        # Popular videos are usually pre-warmed; "refresh" forces a new crawl.
+        warm = None if request.form.get('refresh') == '1' else prewarm.get_warm_result(video_id)
+        if warm:
+            analysis_results = warm['result']
+        else:
+            try:
+                with analysis_governor.slot(session['user_id']):
+                    analysis_results = analyze_youtube_comments(video_id)
+            except AdmissionRejected as e:
+                flash(str(e), 'warning')
+                recent_predictions = get_user_predictions(session['user_id'], limit=5)
+                return (render_template('predict.html', recent_predictions=recent_predictions),
+                        429, {'Retry-After': str(e.retry_after)})
+            except ConnectionError as e:
+                flash(str(e), 'error')
+                return redirect(url_for('predict'))
+            try:
+                prewarm.store_result(video_id, analysis_results)
+            except Exception as e:
+                print(f"❌ Could not store warm analysis: {e}")
 
         if analysis_results.get("error"):
             flash(analysis_results["error"], 'error')
@@ -158,7 +202,8 @@ def predict():
                                     'hate_count': hate_count,
                                     'comments_processed': analysis_results.get("comments_processed", 0),
                                     'hope_comments': analysis_results.get("hope_comments", []),
-                                    'hate_comments': analysis_results.get("hate_comments", [])
+                                    'hate_comments': analysis_results.get("hate_comments", []),
+                                    'data_age': _format_age(warm['age_seconds']) if warm else None
                                 },
                                 recent_predictions=recent_predictions,
                                 show_chatbot_suggestion=show_chatbot_suggestion)
@@ -166,6 +211,176 @@ def predict():
     recent_predictions = get_user_predictions(session['user_id'], limit=5)
     return render_template('predict.html', recent_predictions=recent_predictions)
 
+def _format_age(seconds):
+    """Human-readable age of a stored analysis, e.g. '12 minutes ago'."""
+    if seconds < 60:
+        return 'less than a minute ago'
+    if seconds < 3600:
+        minutes = int(seconds // 60)
+        return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
+    hours = int(seconds // 3600)
+    return f"{hours} hour{'s' if hours != 1 else ''} ago"
+
+@app.route('/export/<video_id>')
+def export_comments(video_id):
+    if 'user_id' not in session:
+        flash('Please log in to export predictions', 'error')
+        return redirect(url_for('login'))
+
+    fmt = request.args.get('format', 'ndjson').lower()
+    dedup = request.args.get('dedup', '1') != '0'
+    video_id = extract_video_id(video_id)
+
+    try:
+        token = analysis_governor.acquire(session['user_id'])
+    except AdmissionRejected as e:
+        return (jsonify({"status": "error", "message": str(e)}),
+                429, {'Retry-After': str(e.retry_after)})
+
+    try:
+        # The first page is fetched before the headers go out, so a bad video
+        # ID or API error gets a proper error response instead of a cut stream.
+        rows = iter_comment_predictions(video_id, dedup=dedup, prefetch=True)
+        chunks, mimetype, extension = export_predictions(rows, fmt)
+    except ValueError as e:
+        analysis_governor.release(token)
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except (ConnectionError, RuntimeError) as e:
+        analysis_governor.release(token)
+        return jsonify({"status": "error", "message": str(e)}), 503
+    except Exception as e:
+        analysis_governor.release(token)
+        status = api_error_status(e)
+        if status in (400, 404):
+            return jsonify({"status": "error", "message": f"Video '{video_id}' not found or has comments disabled."}), 404
+        return jsonify({"status": "error", "message": f"An API error occurred: {e}"}), 502
+
+    # Rows are classified as the response is sent, so nothing is buffered.
+    # The analysis slot is held until the stream finishes or is closed.
+    return Response(
+        stream_with_context(analysis_governor.stream(token, chunks)),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{video_id}_predictions.{extension}"',
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+def _number_arg(name, cast=float, default=None):
+    """
+    Reads a numeric query parameter. Unlike `request.args.get(type=...)`, which
+    silently drops values it cannot convert, raises ValueError for them.
+    """
+    value = request.args.get(name)
+    if value is None or value.strip() == '':
+        return default
+    try:
+        number = cast(value)
+    except ValueError:
+        raise ValueError(f"Invalid value for '{name}': {value!r}")
+    if number != number or number in (float('inf'), float('-inf')):
+        raise ValueError(f"Invalid value for '{name}': {value!r}")
+    return number
+
+@app.route('/api/comments/search')
+def search_comments():
+    if 'user_id' not in session:
+        return jsonify({"status": "error", "message": "Please log in to search comments"}), 401
+
+    try:
+        min_score = _number_arg('min_score')
+        max_score = _number_arg('max_score')
+        # A negative LIMIT means no limit to SQLite.
+        limit = min(max(_number_arg('limit', int, 50), 1), 500)
+        offset = max(_number_arg('offset', int, 0), 0)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    comments = search_comment_predictions(
+        query=request.args.get('q'),
+        video_id=request.args.get('video_id'),
+        label=request.args.get('label'),
+        emotion=request.args.get('emotion'),
+        min_score=min_score,
+        max_score=max_score,
+        limit=limit,
+        offset=offset
+    )
+    return jsonify({"status": "ok", "count": len(comments), "comments": comments})
+
+@app.route('/api/videos/<video_id>/relabel')
+def relabel_video(video_id):
+    """Hope/hate counts under another emotion mapping or threshold, from stored vectors."""
+    if 'user_id' not in session:
+        return jsonify({"status": "error", "message": "Please log in to relabel comments"}), 401
+
+    hope = request.args.get('hope')
+    hope_labels = [label.strip().lower() for label in hope.split(',') if label.strip()] if hope else None
+    try:
+        threshold = _number_arg('threshold')
+        from services.emotion_profile import relabel_video as relabel
+        summary = relabel(video_id, hope_labels=hope_labels, threshold=threshold)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "ok", **summary})
+
+@app.route('/api/batch', methods=['POST'])
+def start_batch():
+    if 'user_id' not in session:
+        return jsonify({"status": "error", "message": "Please log in to run batch analyses"}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        quota_budget = int(data.get('quota_budget', batch.BATCH_QUOTA_BUDGET))
+        job_id = batch.start_batch_job(
+            session['user_id'],
+            video_ids=data.get('video_ids'),
+            channel_id=data.get('channel_id'),
+            playlist_id=data.get('playlist_id'),
+            quota_budget=min(quota_budget, batch.BATCH_QUOTA_BUDGET)
+        )
+    except (ValueError, TypeError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except AdmissionRejected as e:
+        return (jsonify({"status": "error", "message": str(e)}),
+                429, {'Retry-After': str(e.retry_after)})
+
+    return jsonify({"status": "ok", "job_id": job_id,
+                    "status_url": url_for('batch_status', job_id=job_id)}), 202
+
+def _user_batch_job(job_id):
+    job = get_batch_job(job_id)
+    if job is None or job['user_id'] != session['user_id']:
+        return None
+    return job
+
+@app.route('/api/batch/<job_id>')
+def batch_status(job_id):
+    if 'user_id' not in session:
+        return jsonify({"status": "error", "message": "Please log in"}), 401
+    job = _user_batch_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Batch job not found"}), 404
+    return jsonify(batch.batch_report(job))
+
+@app.route('/api/batch/<job_id>/resume', methods=['POST'])
+def resume_batch(job_id):
+    if 'user_id' not in session:
+        return jsonify({"status": "error", "message": "Please log in"}), 401
+    job = _user_batch_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Batch job not found"}), 404
+    if job['status'] in ('completed', 'failed'):
+        return jsonify({"status": "error", "message": f"Batch job is already {job['status']}"}), 409
+    try:
+        batch.check_active_limit(session['user_id'], exclude_job_id=job_id)
+    except AdmissionRejected as e:
+        return (jsonify({"status": "error", "message": str(e)}),
+                429, {'Retry-After': str(e.retry_after)})
+
+    threading.Thread(target=batch.run_batch_job, args=(job_id,), daemon=True).start()
+    return jsonify({"status": "ok", "job_id": job_id}), 202
+
 @app.route('/dashboard')
 def dashboard():
     if 'user_id' not in session:
@@ -240,6 +455,39 @@ def logout():
     return redirect(url_for('views.home'))
 
 
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz')
+def readyz():
+    """
+    Readiness: the classifier is loaded and has run at least one inference.
+    Until then each probe makes sure a background warm-up is running, since a
+    deploy gated on readiness gets no traffic that would warm the model.
+    """
+    if hate_classifier.is_model_ready():
+        return jsonify({"status": "ready", "analysis": analysis_governor.stats()})
+    hate_classifier.start_warm_up()
+    return jsonify({"status": "warming_up"}), 503
+
+
+@app.route('/metrics/prewarm')
+def prewarm_metrics():
+    """
+    Warm-result hit rate, data age and quota use, for tuning the pre-warm
+    schedule. Internal only: callers must send `Authorization: Bearer
+    $METRICS_TOKEN`, and the route is disabled while METRICS_TOKEN is unset.
+    """
+    token = os.environ.get('METRICS_TOKEN')
+    if not token:
+        return jsonify({"status": "error", "message": "Metrics are disabled; set METRICS_TOKEN"}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({"status": "error", "message": "Invalid metrics token"}), 401
+    return jsonify(prewarm.metrics())
+
+
 # chat enpoint
 @app.route("/chat/<prompt>", methods=["POST"])
 def chating(prompt):
@@ -1,8 +1,11 @@
+import json
+import os
 import sqlite3
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
-DATABASE = 'instance/sentiment_app.db'
+# DATABASE_PATH lets load tests and scripts point the app at another file.
+DATABASE = os.environ.get('DATABASE_PATH', 'instance/sentiment_app.db')
 
 def get_db():
     conn = sqlite3.connect(DATABASE)
@@ -46,6 +49,158 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
     ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS comment_predictions (
+            comment_id TEXT PRIMARY KEY,
+            video_id TEXT NOT NULL,
+            text TEXT NOT NULL,
+            emotion TEXT,
+            hope_hate TEXT,
+            score REAL,
+            probs BLOB,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Databases created before emotion vectors were stored lack the column.
+    columns = {row['name'] for row in cursor.execute('PRAGMA table_info(comment_predictions)')}
+    if 'probs' not in columns:
+        cursor.execute('ALTER TABLE comment_predictions ADD COLUMN probs BLOB')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_comment_predictions_video_label '
+        'ON comment_predictions (video_id, hope_hate, score)'
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_comment_predictions_video_emotion '
+        'ON comment_predictions (video_id, emotion, score)'
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_comment_predictions_video_score '
+        'ON comment_predictions (video_id, score)'
+    )
+    # Searches across all videos filter and sort without a video_id prefix.
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_comment_predictions_label '
+        'ON comment_predictions (hope_hate, score)'
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_comment_predictions_emotion '
+        'ON comment_predictions (emotion, score)'
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_comment_predictions_score '
+        'ON comment_predictions (score)'
+    )
+
+    # External-content FTS5 index over the comment text, kept in sync by triggers.
+    # video_id is indexed too, so a text search within one video only reads
+    # that video's postings. Indexes built before it was added are rebuilt.
+    fts_columns = {row['name'] for row in cursor.execute('PRAGMA table_info(comment_predictions_fts)')}
+    if fts_columns and 'video_id' not in fts_columns:
+        cursor.executescript('''
+            DROP TRIGGER IF EXISTS comment_predictions_ai;
+            DROP TRIGGER IF EXISTS comment_predictions_ad;
+            DROP TRIGGER IF EXISTS comment_predictions_au;
+            DROP TABLE comment_predictions_fts;
+        ''')
+    cursor.executescript('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS comment_predictions_fts USING fts5(
+            text, video_id, content='comment_predictions', content_rowid='rowid'
+        );
+        CREATE TRIGGER IF NOT EXISTS comment_predictions_ai AFTER INSERT ON comment_predictions BEGIN
+            INSERT INTO comment_predictions_fts (rowid, text, video_id) VALUES (new.rowid, new.text, new.video_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS comment_predictions_ad AFTER DELETE ON comment_predictions BEGIN
+            INSERT INTO comment_predictions_fts (comment_predictions_fts, rowid, text, video_id)
+            VALUES ('delete', old.rowid, old.text, old.video_id);
+        END;
+        -- Re-analysis upserts every row; only a changed text needs reindexing.
+        DROP TRIGGER IF EXISTS comment_predictions_au;
+        CREATE TRIGGER comment_predictions_au AFTER UPDATE OF text, video_id ON comment_predictions
+        WHEN old.text IS NOT new.text OR old.video_id IS NOT new.video_id BEGIN
+            INSERT INTO comment_predictions_fts (comment_predictions_fts, rowid, text, video_id)
+            VALUES ('delete', old.rowid, old.text, old.video_id);
+            INSERT INTO comment_predictions_fts (rowid, text, video_id) VALUES (new.rowid, new.text, new.video_id);
+        END;
+    ''')
+    if fts_columns and 'video_id' not in fts_columns:
+        cursor.execute("INSERT INTO comment_predictions_fts (comment_predictions_fts) VALUES ('rebuild')")
+        conn.commit()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS batch_jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            source_type TEXT NOT NULL,
+            source_id TEXT,
+            status TEXT NOT NULL,
+            quota_budget INTEGER NOT NULL,
+            quota_used INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS batch_job_videos (
+            job_id TEXT NOT NULL,
+            video_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            result TEXT,
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job_id, video_id),
+            FOREIGN KEY (job_id) REFERENCES batch_jobs (id)
+        )
+    ''')
+
+    # API quota units spent by all batch jobs per UTC day, shared by every process.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS batch_quota_days (
+            day TEXT PRIMARY KEY,
+            used INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Popular-video lookups for pre-warming scan recent predictions by time.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions (timestamp, video_id)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS warm_analyses (
+            video_id TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            source TEXT NOT NULL,
+            quota_used INTEGER NOT NULL DEFAULT 0,
+            refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_warm_analyses_refreshed ON warm_analyses (refreshed_at)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS prewarm_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            videos_refreshed INTEGER NOT NULL DEFAULT 0,
+            quota_used INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS warm_lookups (
+            day TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0,
+            hit_age_sum REAL NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # WAL lets searches keep reading while large comment batches are written.
+    cursor.execute('PRAGMA journal_mode=WAL')
     
     conn.commit()
     conn.close()
@@ -167,6 +322,359 @@ def get_tracker_history(user_id, limit=3):
     conn.close()
     return [dict(row) for row in history]
 
+def add_comment_predictions(video_id, rows):
+    """
+    Upserts a batch of per-comment predictions in a single transaction.
+    `rows` are `predict_hope_hate` outputs carrying a "comment_id"; their
+    float16 "probs" vector, when present, is stored as raw bytes.
+    """
+    conn = get_db()
+    conn.execute('PRAGMA synchronous=NORMAL')
+    with conn:
+        conn.executemany(
+            '''
+            INSERT INTO comment_predictions (comment_id, video_id, text, emotion, hope_hate, score, probs)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (comment_id) DO UPDATE SET
+                text = excluded.text,
+                emotion = excluded.emotion,
+                hope_hate = excluded.hope_hate,
+                score = excluded.score,
+                probs = excluded.probs,
+                updated_at = CURRENT_TIMESTAMP
+            ''',
+            [
+                (row['comment_id'], video_id, row['text'], row['emotion'], row['hope_hate'], row['score'],
+                 row['probs'].tobytes() if row.get('probs') is not None else None)
+                for row in rows if row.get('comment_id')
+            ]
+        )
+    conn.close()
+
+def get_comment_probabilities(video_id):
+    """
+    Returns the stored emotion vectors of a video's comments as raw bytes,
+    plus how many of its comments were stored without one.
+    """
+    conn = get_db()
+    blobs = [row[0] for row in conn.execute(
+        'SELECT probs FROM comment_predictions WHERE video_id = ? AND probs IS NOT NULL', (video_id,)
+    )]
+    missing = conn.execute(
+        'SELECT COUNT(*) FROM comment_predictions WHERE video_id = ? AND probs IS NULL', (video_id,)
+    ).fetchone()[0]
+    conn.close()
+    return blobs, missing
+
+def _fts_phrase(value):
+    return '"' + value.replace('"', '""') + '"'
+
+def _fts_query(query, video_id=None):
+    """
+    Quotes each search term so user input is never parsed as FTS5 syntax.
+    Terms only match the text column; `video_id` narrows the match to that
+    video's postings (the exact ID is still checked on the joined row).
+    """
+    expression = 'text : (' + ' '.join(_fts_phrase(term) for term in query.split()) + ')'
+    if video_id:
+        expression += ' AND video_id : ' + _fts_phrase(video_id)
+    return expression
+
+def search_comment_predictions(query=None, video_id=None, label=None, emotion=None,
+                               min_score=None, max_score=None, limit=50, offset=0):
+    """
+    Searches stored comment predictions. `query` is matched against the FTS5
+    index (all terms must appear, best matches first); the other arguments
+    filter on the indexed columns.
+    """
+    conditions = []
+    params = []
+
+    if query and query.strip():
+        sql = (
+            'SELECT c.comment_id, c.video_id, c.text, c.emotion, c.hope_hate, c.score, c.updated_at '
+            'FROM comment_predictions_fts f JOIN comment_predictions c ON c.rowid = f.rowid '
+        )
+        conditions.append('comment_predictions_fts MATCH ?')
+        params.append(_fts_query(query, video_id))
+        order = 'ORDER BY f.rank'
+    else:
+        sql = (
+            'SELECT c.comment_id, c.video_id, c.text, c.emotion, c.hope_hate, c.score, c.updated_at '
+            'FROM comment_predictions c '
+        )
+        order = 'ORDER BY c.score DESC'
+
+    if video_id:
+        conditions.append('c.video_id = ?')
+        params.append(video_id)
+    if label:
+        conditions.append('c.hope_hate = ?')
+        params.append(label.capitalize())
+    if emotion:
+        conditions.append('c.emotion = ?')
+        params.append(emotion.lower())
+    if min_score is not None:
+        conditions.append('c.score >= ?')
+        params.append(min_score)
+    if max_score is not None:
+        conditions.append('c.score <= ?')
+        params.append(max_score)
+
+    if conditions:
+        sql += 'WHERE ' + ' AND '.join(conditions) + ' '
+    sql += order + ' LIMIT ? OFFSET ?'
+    params.extend([limit, offset])
+
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    comments = cursor.fetchall()
+    conn.close()
+    return [dict(row) for row in comments]
+
+def create_batch_job(job_id, user_id, source_type, source_id, quota_budget):
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        'INSERT INTO batch_jobs (id, user_id, source_type, source_id, status, quota_budget) VALUES (?, ?, ?, ?, ?, ?)',
+        (job_id, user_id, source_type, source_id, 'resolving', quota_budget)
+    )
+    conn.commit()
+    conn.close()
+    return job_id
+
+def add_batch_job_videos(job_id, video_ids):
+    conn = get_db()
+    with conn:
+        conn.executemany(
+            'INSERT OR IGNORE INTO batch_job_videos (job_id, video_id, position) VALUES (?, ?, ?)',
+            [(job_id, video_id, position) for position, video_id in enumerate(video_ids)]
+        )
+    conn.close()
+
+def update_batch_job(job_id, status=None, quota_used=None, error=None, quota_budget=None):
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        '''
+        UPDATE batch_jobs SET
+            status = COALESCE(?, status),
+            quota_used = COALESCE(?, quota_used),
+            quota_budget = COALESCE(?, quota_budget),
+            error = COALESCE(?, error),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+        ''',
+        (status, quota_used, quota_budget, error, job_id)
+    )
+    conn.commit()
+    conn.close()
+
+def update_batch_job_video(job_id, video_id, status, result=None, error=None):
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        'UPDATE batch_job_videos SET status = ?, result = ?, error = ?, updated_at = CURRENT_TIMESTAMP '
+        'WHERE job_id = ? AND video_id = ?',
+        (status, json.dumps(result) if result is not None else None, error, job_id, video_id)
+    )
+    conn.commit()
+    conn.close()
+
+def get_batch_job(job_id):
+    """Returns the job row with its videos (results decoded), or None."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM batch_jobs WHERE id = ?', (job_id,))
+    job = cursor.fetchone()
+    if not job:
+        conn.close()
+        return None
+    cursor.execute('SELECT * FROM batch_job_videos WHERE job_id = ? ORDER BY position', (job_id,))
+    videos = cursor.fetchall()
+    conn.close()
+
+    job = dict(job)
+    job['videos'] = []
+    for row in videos:
+        video = dict(row)
+        video['result'] = json.loads(video['result']) if video['result'] else None
+        job['videos'].append(video)
+    return job
+
+def get_unfinished_batch_jobs():
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id FROM batch_jobs WHERE status NOT IN ('completed', 'failed') ORDER BY created_at"
+    )
+    jobs = cursor.fetchall()
+    conn.close()
+    return [row['id'] for row in jobs]
+
+def count_active_batch_jobs(user_id, exclude_job_id=None):
+    """Number of the user's jobs that are resolving, pending or running."""
+    conn = get_db()
+    count = conn.execute(
+        "SELECT COUNT(*) FROM batch_jobs WHERE user_id = ? AND status IN ('resolving', 'pending', 'running') "
+        "AND id IS NOT ?",
+        (user_id, exclude_job_id)
+    ).fetchone()[0]
+    conn.close()
+    return count
+
+def charge_batch_daily_quota(units, limit):
+    """
+    Adds `units` to today's batch quota use if that keeps it within `limit`.
+    Returns False, charging nothing, when it would not.
+    """
+    conn = get_db()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO batch_quota_days (day, used) VALUES (date('now'), 0)")
+        cursor = conn.execute(
+            "UPDATE batch_quota_days SET used = used + ? WHERE day = date('now') AND used + ? <= ?",
+            (units, units, limit)
+        )
+    conn.close()
+    return cursor.rowcount == 1
+
+def get_batch_quota_used_today():
+    conn = get_db()
+    row = conn.execute("SELECT used FROM batch_quota_days WHERE day = date('now')").fetchone()
+    conn.close()
+    return row['used'] if row else 0
+
+
+def get_popular_videos(limit=20, days=7):
+    """Most-requested video IDs over the last `days` days, as (video_id, requests) pairs."""
+    conn = get_db()
+    rows = conn.execute(
+        "SELECT video_id, COUNT(*) AS requests FROM predictions "
+        "WHERE timestamp >= datetime('now', ?) "
+        "GROUP BY video_id ORDER BY requests DESC, MAX(timestamp) DESC LIMIT ?",
+        (f'-{int(days)} days', limit)
+    ).fetchall()
+    conn.close()
+    return [(row['video_id'], row['requests']) for row in rows]
+
+def save_warm_analysis(video_id, result, source, quota_used=0):
+    conn = get_db()
+    conn.execute(
+        '''
+        INSERT INTO warm_analyses (video_id, result, source, quota_used, refreshed_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (video_id) DO UPDATE SET
+            result = excluded.result,
+            source = excluded.source,
+            quota_used = excluded.quota_used,
+            refreshed_at = CURRENT_TIMESTAMP
+        ''',
+        (video_id, json.dumps(result), source, quota_used)
+    )
+    conn.commit()
+    conn.close()
+
+_WARM_AGE = "CAST(strftime('%s', 'now') - strftime('%s', refreshed_at) AS INTEGER) AS age_seconds"
+
+def get_warm_analysis(video_id):
+    """The stored analysis for a video with its age in seconds, or None."""
+    conn = get_db()
+    row = conn.execute(
+        f'SELECT video_id, result, source, refreshed_at, {_WARM_AGE} FROM warm_analyses WHERE video_id = ?',
+        (video_id,)
+    ).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    warm = dict(row)
+    warm['result'] = json.loads(warm['result'])
+    return warm
+
+def prune_warm_analyses(max_age_seconds):
+    """Deletes stored analyses older than `max_age_seconds`; returns how many."""
+    conn = get_db()
+    with conn:
+        cursor = conn.execute(
+            "DELETE FROM warm_analyses WHERE refreshed_at < datetime('now', ?)",
+            (f'-{int(max_age_seconds)} seconds',)
+        )
+    conn.close()
+    return cursor.rowcount
+
+def prune_prewarm_history(days):
+    """Deletes refresher runs and daily lookup totals older than `days` days."""
+    conn = get_db()
+    with conn:
+        conn.execute("DELETE FROM prewarm_runs WHERE started_at < datetime('now', ?)", (f'-{int(days)} days',))
+        conn.execute("DELETE FROM warm_lookups WHERE day < date('now', ?)", (f'-{int(days)} days',))
+    conn.close()
+
+def get_warm_analysis_ages():
+    conn = get_db()
+    rows = conn.execute(
+        f'SELECT video_id, source, {_WARM_AGE} FROM warm_analyses ORDER BY refreshed_at DESC'
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def start_prewarm_run():
+    conn = get_db()
+    cursor = conn.execute('INSERT INTO prewarm_runs DEFAULT VALUES')
+    conn.commit()
+    run_id = cursor.lastrowid
+    conn.close()
+    return run_id
+
+def update_prewarm_run(run_id, videos_refreshed, quota_used, error=None, finished=False):
+    conn = get_db()
+    conn.execute(
+        'UPDATE prewarm_runs SET videos_refreshed = ?, quota_used = ?, error = ?, '
+        'finished_at = CASE WHEN ? THEN CURRENT_TIMESTAMP ELSE finished_at END WHERE id = ?',
+        (videos_refreshed, quota_used, error, finished, run_id)
+    )
+    conn.commit()
+    conn.close()
+
+def get_prewarm_quota_used_today():
+    """API quota units the refresher has spent since midnight UTC."""
+    conn = get_db()
+    used = conn.execute(
+        "SELECT COALESCE(SUM(quota_used), 0) FROM prewarm_runs WHERE started_at >= date('now')"
+    ).fetchone()[0]
+    conn.close()
+    return used
+
+def get_recent_prewarm_runs(limit=5):
+    conn = get_db()
+    rows = conn.execute('SELECT * FROM prewarm_runs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def record_warm_lookup(hit, age_seconds=0):
+    """Counts one /predict lookup in today's warm-result hit/miss totals."""
+    conn = get_db()
+    conn.execute(
+        '''
+        INSERT INTO warm_lookups (day, hits, misses, hit_age_sum) VALUES (date('now'), ?, ?, ?)
+        ON CONFLICT (day) DO UPDATE SET
+            hits = hits + excluded.hits,
+            misses = misses + excluded.misses,
+            hit_age_sum = hit_age_sum + excluded.hit_age_sum
+        ''',
+        (1 if hit else 0, 0 if hit else 1, age_seconds if hit else 0)
+    )
+    conn.commit()
+    conn.close()
+
+def get_warm_lookup_stats(days=7):
+    conn = get_db()
+    rows = conn.execute(
+        "SELECT * FROM warm_lookups WHERE day >= date('now', ?) ORDER BY day DESC",
+        (f'-{int(days)} days',)
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
 
 if __name__ == '__main__':
     import os
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP load test for the web app.
+
+Seeds a database and a fake YouTube fixture, starts `app` under gunicorn
+with stubbed YouTube / classifier / Gemini services (see stub_app.py), then
+drives a traffic profile with concurrent virtual users. Each virtual user
+logs in as a seeded account and keeps its own session.
+
+For every route it reports throughput, p50/p95/p99 latency, the error rate
+and how many requests were shed with 429. Give several --concurrency values
+to step the load up and see where throughput stops growing:
+
+    python scripts/loadtest/run.py --profile mixed --concurrency 4 8 16 32
+    python scripts/loadtest/run.py --profile browse --save baseline.json
+    python scripts/loadtest/run.py --profile browse --baseline baseline.json
+
+/predict normally answers from a stored ("warm") analysis of a recently
+analysed video. The "predict" route therefore sends refresh=1 so it always
+times a cold analysis. --warm-share moves that fraction of predict requests
+to "predict_warm", which may be served from stored results and is reported
+as its own route.
+
+With --baseline the exit status is 1 when a route's p95 grew, its throughput
+dropped, or its error rate rose beyond --tolerance. That makes the script
+usable as a pre-deploy check. --url targets an already running server
+instead, which must already hold the seeded users.
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(HERE, "..", ".."))
+sys.path.insert(0, HERE)
+
+from seed import LOADTEST_PASSWORD, seed_database, user_email, video_ids, write_fixture  # noqa: E402
+
+# Route name -> (method, path template, expected statuses).
+ROUTES = {
+    "home": ("GET", "/", (200,)),
+    "login": ("POST", "/login", (302,)),
+    "dashboard": ("GET", "/dashboard", (200,)),
+    "predict_page": ("GET", "/predict", (200,)),
+    "predict": ("POST", "/predict", (200,)),
+    "predict_warm": ("POST", "/predict", (200,)),
+    "chatbot_page": ("GET", "/chatbot", (200,)),
+    "chat": ("POST", "/chat/<prompt>", (200,)),
+    "search": ("GET", "/api/comments/search", (200,)),
+    "healthz": ("GET", "/healthz", (200,)),
+}
+
+# Relative request weights per traffic profile.
+PROFILES = {
+    "browse": {"home": 3, "dashboard": 4, "predict_page": 2, "chatbot_page": 1, "login": 1},
+    "mixed": {"home": 2, "login": 1, "dashboard": 3, "predict_page": 1, "predict": 2,
+              "chat": 1, "search": 1},
+    "predict": {"predict": 6, "predict_page": 1, "dashboard": 2, "search": 1},
+    "chat": {"chat": 6, "chatbot_page": 2, "dashboard": 1},
+    "login": {"login": 1},
+}
+
+_CHAT_PROMPTS = [
+    "How do I grow a cooking channel from 1k subscribers",
+    "Give me five title ideas for a travel vlog",
+    "How should I respond to negative comments",
+    "What upload schedule works for small channels",
+]
+_SEARCH_TERMS = ["love", "worst", "great", "time", "channel"]
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Lets 3xx responses through as results so redirects are not timed twice."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class VirtualUser:
+    """One logged-in client with its own cookie jar."""
+
+    def __init__(self, base_url, email, videos, rng, timeout, warm_share=0.0):
+        self.base_url = base_url
+        self.email = email
+        self.videos = videos
+        self.rng = rng
+        self.timeout = timeout
+        self.warm_share = warm_share
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def _request(self, route):
+        method, path, _ = ROUTES[route]
+        data = None
+        if route == "login":
+            data = {"email": self.email, "password": LOADTEST_PASSWORD}
+        elif route == "predict":
+            data = {"video_id": self.rng.choice(self.videos), "refresh": "1"}
+        elif route == "predict_warm":
+            data = {"video_id": self.rng.choice(self.videos)}
+        elif route == "chat":
+            path = "/chat/" + urllib.parse.quote(self.rng.choice(_CHAT_PROMPTS))
+        elif route == "search":
+            path += "?" + urllib.parse.urlencode({"q": self.rng.choice(_SEARCH_TERMS), "limit": 20})
+        body = urllib.parse.urlencode(data).encode() if data is not None else (b"" if method == "POST" else None)
+        return urllib.request.Request(self.base_url + path, data=body, method=method)
+
+    def call(self, route):
+        """Performs one request; returns (latency seconds, status code or 0 on failure)."""
+        request = self._request(route)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except (urllib.error.URLError, OSError):
+            status = 0
+        return time.perf_counter() - started, status
+
+
+def _run_user(user, weights, stop, record, samples):
+    routes, route_weights = zip(*weights.items())
+    while not stop.is_set():
+        route = user.rng.choices(routes, route_weights)[0]
+        if route == "predict" and user.warm_share and user.rng.random() < user.warm_share:
+            route = "predict_warm"
+        latency, status = user.call(route)
+        if record.is_set():
+            samples.append((route, latency, status))
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, duration):
+    """Per-route and overall statistics for one stage."""
+    by_route = {}
+    for route, latency, status in samples:
+        by_route.setdefault(route, []).append((latency, status))
+    by_route["ALL"] = [(latency, status) for _, latency, status in samples]
+
+    report = {}
+    for route, entries in by_route.items():
+        latencies = sorted(latency for latency, _ in entries)
+        shed = sum(1 for _, status in entries if status == 429)
+        if route == "ALL":
+            errors = sum(1 for (r, _, status) in samples if status != 429 and status not in ROUTES[r][2])
+        else:
+            errors = sum(1 for _, status in entries if status != 429 and status not in ROUTES[route][2])
+        report[route] = {
+            "requests": len(entries),
+            "rps": round(len(entries) / duration, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+            "error_rate": round(errors / len(entries), 4) if entries else 0.0,
+            "shed_429": shed,
+        }
+    return report
+
+
+def run_stage(base_url, users, weights, videos, concurrency, duration, warmup, timeout, seed, warm_share=0.0):
+    """Runs `concurrency` virtual users for warmup + duration seconds."""
+    stop, record = threading.Event(), threading.Event()
+    samples = []
+    threads = []
+    for i in range(concurrency):
+        rng = random.Random(seed * 1000 + i)
+        user = VirtualUser(base_url, users[i % len(users)], videos, rng, timeout, warm_share)
+        user.call("login")
+        thread = threading.Thread(target=_run_user, args=(user, weights, stop, record, samples), daemon=True)
+        threads.append(thread)
+        thread.start()
+
+    time.sleep(warmup)
+    record.set()
+    started = time.monotonic()
+    time.sleep(duration)
+    record.clear()
+    elapsed = time.monotonic() - started
+    stop.set()
+    for thread in threads:
+        thread.join(timeout + 1)
+    return summarize(samples, elapsed)
+
+
+def print_report(concurrency, report):
+    print(f"\n=== {concurrency} virtual users ===")
+    print(f"{'route':<14}{'reqs':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}{'429':>6}")
+    for route in sorted(report, key=lambda r: (r == "ALL", r)):
+        s = report[route]
+        print(f"{route:<14}{s['requests']:>7}{s['rps']:>9.2f}{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}"
+              f"{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}{s['error_rate'] * 100:>7.1f}%{s['shed_429']:>6}")
+
+
+def compare(stages, baseline, tolerance):
+    """Returns the regressions of `stages` against a saved baseline report."""
+    regressions = []
+    previous = {str(stage["concurrency"]): stage["routes"] for stage in baseline["stages"]}
+    for stage in stages:
+        old_routes = previous.get(str(stage["concurrency"]))
+        if not old_routes:
+            continue
+        for route, new in stage["routes"].items():
+            old = old_routes.get(route)
+            if not old or old["requests"] < 20 or new["requests"] < 20:
+                continue
+            where = f"{route} @ {stage['concurrency']} users"
+            if new["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{where}: p95 {old['p95_ms']} -> {new['p95_ms']} ms")
+            if new["rps"] < old["rps"] * (1 - tolerance):
+                regressions.append(f"{where}: throughput {old['rps']} -> {new['rps']} req/s")
+            if new["error_rate"] > old["error_rate"] + 0.01:
+                regressions.append(f"{where}: error rate {old['error_rate']:.2%} -> {new['error_rate']:.2%}")
+    return regressions
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, workdir, fixture, db_path):
+    """Starts gunicorn on a free port and waits until /healthz answers."""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        DATABASE_PATH=db_path,
+        YOUTUBE_FAKE_DATA=fixture,
+        YOUTUBE_FAKE_LATENCY=str(args.youtube_latency_ms / 1000),
+        LOADTEST_CLASSIFIER_LATENCY_MS=str(args.classifier_latency_ms),
+        LOADTEST_GEMINI_LATENCY_MS=str(args.gemini_latency_ms),
+        WEB_CONCURRENCY=str(args.workers),
+        WARMUP_MODEL="0",
+        PREWARM_ENABLED="0",
+        SHARDED_ANALYSIS="0",
+        WORK_QUEUE_DB=os.path.join(workdir, "work_queue.db"),
+    )
+    log_path = os.path.join(workdir, "gunicorn.log")
+    log = open(log_path, "w")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn",
+         "--workers", str(args.workers), "--threads", str(args.threads),
+         "--bind", f"127.0.0.1:{port}", "--timeout", str(int(args.timeout) + 30),
+         "--pythonpath", f"{REPO_ROOT},{HERE}", "--chdir", REPO_ROOT,
+         "stub_app:app"],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            break
+        try:
+            with urllib.request.urlopen(base_url + "/healthz", timeout=2):
+                print(f"✅ gunicorn ready at {base_url} ({args.workers} workers x {args.threads} threads); log: {log_path}")
+                return server, base_url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.25)
+    server.kill()
+    log.close()
+    with open(log_path) as f:
+        tail = f.read()[-2000:]
+    raise RuntimeError(f"gunicorn did not start:\n{tail}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the web app with stubbed external services.")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="mixed")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8], help="Virtual users; several values run as stages.")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds per stage.")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before each stage.")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds.")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes.")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker.")
+    parser.add_argument("--classifier-latency-ms", type=float, default=5, help="Stub classifier delay per comment.")
+    parser.add_argument("--gemini-latency-ms", type=float, default=800, help="Stub Gemini delay per reply.")
+    parser.add_argument("--youtube-latency-ms", type=float, default=50, help="Fake YouTube API delay per call.")
+    parser.add_argument("--users", type=int, default=200, help="Seeded user accounts.")
+    parser.add_argument("--videos", type=int, default=50, help="Fake videos to predict on.")
+    parser.add_argument("--comments", type=int, default=300, help="Comments per fake video.")
+    parser.add_argument("--warm-share", type=float, default=0.0,
+                        help="Fraction of predict requests that may be served from stored analyses.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", default=os.path.join("instance", "sentiment_app.db"), help="Database to seed and serve.")
+    parser.add_argument("--url", help="Test an already running server instead of starting one.")
+    parser.add_argument("--save", help="Write the report as JSON.")
+    parser.add_argument("--baseline", help="Compare against a report saved with --save.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change against the baseline.")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    db_path = os.path.abspath(os.path.join(REPO_ROOT, args.db) if not os.path.isabs(args.db) else args.db)
+    fixture = os.path.join(workdir, "youtube_fixture.json")
+    videos = video_ids(args.videos)
+    users = [user_email(i) for i in range(args.users)]
+
+    server = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            write_fixture(fixture, args.videos, args.comments, args.seed)
+            seed_database(db_path, args.users, args.videos, args.seed)
+            print(f"✅ Seeded {args.users} users in '{db_path}'.")
+            server, base_url = start_server(args, workdir, fixture, db_path)
+
+        stages = []
+        for concurrency in args.concurrency:
+            report = run_stage(base_url, users, PROFILES[args.profile], videos, concurrency,
+                               args.duration, args.warmup, args.timeout, args.seed, args.warm_share)
+            print_report(concurrency, report)
+            stages.append({"concurrency": concurrency, "routes": report})
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    if len(stages) > 1:
+        print("\nThroughput by load:")
+        for stage in stages:
+            overall = stage["routes"]["ALL"]
+            print(f"  {stage['concurrency']:>4} users: {overall['rps']:>8.2f} req/s, p95 {overall['p95_ms']:.1f} ms, "
+                  f"errors {overall['error_rate'] * 100:.1f}%")
+
+    result = {
+        "profile": args.profile,
+        "settings": {key: getattr(args, key) for key in (
+            "duration", "workers", "threads", "classifier_latency_ms", "gemini_latency_ms", "youtube_latency_ms",
+            "warm_share")},
+        "stages": stages,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Report saved to '{args.save}'.")
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(stages, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Regressions against the baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            status = 1
+        else:
+            print("\n✅ No regressions against the baseline.")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic data for load tests.
+
+* `write_fixture` builds a fake YouTube fixture (see `services.fake_youtube`):
+  videos with a few hundred English comments each, a mix of hopeful and
+  hostile ones, plus the usual spam duplicates.
+* `seed_database` creates load-test users, all sharing LOADTEST_PASSWORD,
+  with a realistic spread of past predictions and tracker history.
+
+The same seed always produces the same data:
+
+    python scripts/loadtest/seed.py --db instance/sentiment_app.db --users 200
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+LOADTEST_PASSWORD = "loadtest-pass"
+CHANNEL_ID = "UCloadtest"
+UPLOADS_PLAYLIST = "UUloadtest"
+
+_HOPE_PHRASES = [
+    "This video made my day, thank you so much",
+    "I love how clearly you explain everything",
+    "Great work, this really helped me understand the topic",
+    "Such an inspiring story, keep going",
+    "Amazing editing and a wonderful message",
+    "You always bring so much joy to this channel",
+]
+_HATE_PHRASES = [
+    "This is the worst video I have watched all week",
+    "Terrible advice, you clearly have no idea what you are talking about",
+    "I hate how long this takes to get to the point",
+    "Stop spreading this nonsense, it is embarrassing",
+    "What a waste of time, unsubscribed",
+    "The audio is awful and the content is even worse",
+]
+_TAILS = ["", " really", " honestly", " to be fair", " as always", " again", " today"]
+_SPAM = "Check out my channel for free giveaways!!!"
+
+
+def video_ids(count):
+    return [f"loadvid{i:04d}" for i in range(count)]
+
+
+def write_fixture(path, videos=50, comments_per_video=300, seed=0):
+    """Writes a fake YouTube API fixture and returns its video IDs."""
+    rng = random.Random(seed)
+    data = {"videos": {}, "channels": {}, "playlists": {}}
+    ids = video_ids(videos)
+    for n, video_id in enumerate(ids):
+        hope_share = rng.uniform(0.2, 0.8)
+        comments = []
+        for i in range(comments_per_video):
+            if rng.random() < 0.05:
+                text = _SPAM
+            else:
+                phrases = _HOPE_PHRASES if rng.random() < hope_share else _HATE_PHRASES
+                text = rng.choice(phrases) + rng.choice(_TAILS) + rng.choice([".", "!", "!!", " :)"])
+            comments.append({"id": f"{video_id}-c{i}", "text": text})
+        data["videos"][video_id] = {
+            "channelId": CHANNEL_ID,
+            "statistics": {"viewCount": str(1000 + n * 37), "likeCount": str(50 + n * 3), "commentCount": str(comments_per_video)},
+            "comments": comments,
+        }
+    data["channels"][CHANNEL_ID] = {"uploads": UPLOADS_PLAYLIST, "statistics": {"subscriberCount": "12000"}}
+    data["playlists"][UPLOADS_PLAYLIST] = ids
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    return ids
+
+
+def user_email(i):
+    return f"loadtest{i}@example.com"
+
+
+def seed_database(db_path, users=200, videos=50, seed=0):
+    """
+    Creates `users` load-test accounts (skipping ones that already exist) with
+    past predictions and tracker history. Returns the seeded users' emails.
+    """
+    os.environ["DATABASE_PATH"] = db_path
+    sys.path.insert(0, REPO_ROOT)
+    import database
+    from werkzeug.security import generate_password_hash
+
+    database.DATABASE = db_path
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    database.init_db()
+
+    rng = random.Random(seed)
+    ids = video_ids(videos)
+    # Every account shares one hash: hashing per user would dominate seeding time.
+    password = generate_password_hash(LOADTEST_PASSWORD, method='pbkdf2:sha256')
+    now = datetime.utcnow()
+
+    conn = database.get_db()
+    with conn:
+        for i in range(users):
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO users (username, email, password) VALUES (?, ?, ?)',
+                (f"loadtest{i}", user_email(i), password)
+            )
+            if cursor.rowcount == 0:
+                continue
+            user_id = cursor.lastrowid
+            # Most users have a handful of predictions, a few have many.
+            count = min(int(rng.paretovariate(1.2) * 3), 200)
+            predictions = []
+            for _ in range(count):
+                timestamp = now - timedelta(minutes=rng.randint(0, 90 * 24 * 60))
+                sentiment = rng.choices(['Positive', 'Negative', 'Neutral'], weights=[5, 4, 1])[0]
+                predictions.append((user_id, rng.choice(ids), sentiment, timestamp.strftime('%Y-%m-%d %H:%M:%S')))
+            conn.executemany(
+                'INSERT INTO predictions (user_id, video_id, sentiment, timestamp) VALUES (?, ?, ?, ?)',
+                predictions
+            )
+            for _ in range(rng.randint(0, 3)):
+                video_id = rng.choice(ids)
+                conn.execute(
+                    'INSERT INTO tracker_history (user_id, video_id, views_plot_path, likes_plot_path, subscribers_plot_path) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (user_id, video_id, f"images/{video_id}_views.png",
+                     f"images/{video_id}_likes.png", f"images/{video_id}_subscribers.png")
+                )
+    conn.close()
+    return [user_email(i) for i in range(users)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed load-test users and a fake YouTube fixture.")
+    parser.add_argument("--db", default=os.path.join("instance", "sentiment_app.db"))
+    parser.add_argument("--fixture", default=os.path.join("instance", "loadtest", "youtube_fixture.json"))
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--videos", type=int, default=50)
+    parser.add_argument("--comments", type=int, default=300, help="Comments per fake video.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    write_fixture(args.fixture, args.videos, args.comments, args.seed)
+    seed_database(args.db, args.users, args.videos, args.seed)
+    print(f"✅ Seeded {args.users} users in '{args.db}' and {args.videos} fake videos in '{args.fixture}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+WSGI entry point for load tests: the real `app`, with the external services
+replaced by deterministic stubs.
+
+* YouTube: the fixture-backed fake API (YOUTUBE_FAKE_DATA, with
+  YOUTUBE_FAKE_LATENCY seconds per call).
+* Classifier: a hash of the comment text gives the emotion probabilities, after
+  LOADTEST_CLASSIFIER_LATENCY_MS milliseconds per comment.
+* Gemini: a canned reply after LOADTEST_GEMINI_LATENCY_MS milliseconds.
+
+Everything else (Flask, sessions, SQLite, the analysis governor) is the
+production code path. Served by `run.py` as:
+
+    gunicorn --pythonpath .,scripts/loadtest stub_app:app
+"""
+import hashlib
+import os
+import time
+
+import numpy as np
+
+CLASSIFIER_LATENCY = float(os.environ.get("LOADTEST_CLASSIFIER_LATENCY_MS", "5")) / 1000
+GEMINI_LATENCY = float(os.environ.get("LOADTEST_GEMINI_LATENCY_MS", "800")) / 1000
+
+if not os.environ.get("YOUTUBE_FAKE_DATA"):
+    raise RuntimeError("Set YOUTUBE_FAKE_DATA to a fixture file (see scripts/loadtest/seed.py).")
+
+from services import gemini_chat, hate_classifier  # noqa: E402
+import services.youtube  # noqa: E402
+
+
+def stub_predict_hope_hate(text):
+    """Deterministic stand-in for `hate_classifier.predict_hope_hate`."""
+    if CLASSIFIER_LATENCY:
+        time.sleep(CLASSIFIER_LATENCY)
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    weights = np.frombuffer(digest[:len(hate_classifier.EMOTION_LABELS)], dtype=np.uint8) + 1.0
+    probs = (weights / weights.sum()).astype(np.float16)
+    best = int(probs.argmax())
+    emotion = hate_classifier.EMOTION_LABELS[best]
+    return {
+        "text": text,
+        "hope_hate": "Hope" if emotion in hate_classifier.HOPE_LABELS else "Hate",
+        "emotion": emotion,
+        "score": round(float(probs[best]), 3),
+        "probs": probs,
+        "source": "stub",
+    }
+
+
+def stub_chatbot(prompt):
+    """Deterministic stand-in for `gemini_chat.chatbot`."""
+    if GEMINI_LATENCY:
+        time.sleep(GEMINI_LATENCY)
+    return f"(stub) Here are three ideas for: {prompt[:80]}"
+
+
+hate_classifier.predict_hope_hate = stub_predict_hope_hate
+services.youtube.predict_hope_hate = stub_predict_hope_hate
+hate_classifier.is_model_ready = lambda: True
+gemini_chat.chatbot = stub_chatbot
+
+from app import app  # noqa: E402,F401
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Measures how long `import app` takes, and which modules dominate it.
+
+Runs the import in fresh interpreters with `python -X importtime` and reports
+the median total plus the slowest top-level imports. Pass `--rev` to measure
+another git revision (e.g. the commit before lazy imports) for comparison:
+
+    python scripts/measure_import_time.py
+    python scripts/measure_import_time.py --rev HEAD~1
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _parse(line):
+    """Splits an importtime line into (cumulative_us, depth, module name)."""
+    _, cumulative, name = line[len("import time:"):].split("|")
+    depth = (len(name) - len(name.lstrip()) - 1) // 2
+    return int(cumulative), depth, name.strip()
+
+
+def measure(workdir, module="app", runs=5):
+    """
+    Returns the median cumulative import time of `module` (in microseconds)
+    and its direct imports ranked by median cumulative time.
+    """
+    totals = []
+    children = {}
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=workdir,
+            env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1", WARMUP_MODEL="0"),
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+        # importtime prints children before their parent, so the direct
+        # imports of `module` are the depth-1 lines just above its own line.
+        pending = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            cumulative, depth, name = _parse(line)
+            if depth == 0:
+                if name == module:
+                    totals.append(cumulative)
+                    for child_cumulative, child in pending:
+                        children.setdefault(child, []).append(child_cumulative)
+                pending = []
+            elif depth == 1:
+                pending.append((cumulative, name))
+
+    ranked = sorted(
+        ((statistics.median(times), name) for name, times in children.items()),
+        reverse=True,
+    )
+    return statistics.median(totals) if totals else 0, ranked
+
+
+def _export_revision(rev, target):
+    # Model weights and generated data are not needed to time the imports.
+    archive = subprocess.run(
+        ["git", "archive", rev, "--", ".", ":(exclude)models", ":(exclude)instance", ":(exclude)static/images"],
+        cwd=REPO_ROOT, capture_output=True, check=True
+    )
+    subprocess.run(["tar", "-x", "-C", target], input=archive.stdout, check=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import time of the Flask app.")
+    parser.add_argument("--rev", help="Git revision to measure instead of the working tree.")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = REPO_ROOT
+        if args.rev:
+            _export_revision(args.rev, tmp)
+            workdir = tmp
+        total_us, ranked = measure(workdir, args.module, args.runs)
+
+    label = args.rev or "working tree"
+    print(f"import {args.module} ({label}): median {total_us / 1000:.1f} ms over {args.runs} runs")
+    for cumulative, name in ranked[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
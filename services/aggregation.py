@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Constant-memory aggregation of per-comment predictions.
+
+Instead of keeping every prediction for a video, `CommentAggregator` keeps
+running hope/hate counts, an emotion histogram, streaming score statistics and
+a fixed-size heap of the most confident hope and hate comments to show as
+exemplars on the results page.
+
+Predictions that carry an emotion probability vector ("probs") are also
+folded into a running sum and entropy total. The vectors are buffered in
+small blocks and reduced with matrix operations (see
+`services.emotion_profile`), so the video's mean emotion profile costs no
+per-comment Python arithmetic.
+"""
+import heapq
+import math
+from collections import Counter
+
+TOP_K_EXEMPLARS = 10
+# Probability vectors buffered before they are reduced in one matrix operation.
+PROB_BLOCK_SIZE = 1024
+
+
+class CommentAggregator:
+    """Folds predictions from `predict_hope_hate` into bounded-size summaries."""
+
+    def __init__(self, top_k=TOP_K_EXEMPLARS, keep_results=False):
+        self.top_k = top_k
+        self.hope_count = 0
+        self.hate_count = 0
+        self.comments_processed = 0
+        self.emotions = Counter()
+        self.score_count = 0
+        self.score_mean = 0.0
+        self._score_m2 = 0.0
+        self.score_min = None
+        self.score_max = None
+        self._exemplars = {"hope": [], "hate": []}
+        self._seq = 0
+        self._prob_block = []
+        self._prob_sum = None
+        self._prob_count = 0
+        self._entropy_sum = 0.0
+        self.results = [] if keep_results else None
+
+    def add(self, prediction, exemplar=True):
+        """
+        Adds one prediction. Pass `exemplar=False` for comments that should be
+        counted but never shown (e.g. collapsed duplicates of a spam comment).
+        """
+        self.comments_processed += 1
+        label = prediction["hope_hate"].lower()
+        if label == "hope":
+            self.hope_count += 1
+        else:
+            self.hate_count += 1
+        self.emotions[prediction["emotion"]] += 1
+
+        score = float(prediction["score"])
+        # Welford's online update keeps mean/variance exact without storing scores.
+        self.score_count += 1
+        delta = score - self.score_mean
+        self.score_mean += delta / self.score_count
+        self._score_m2 += delta * (score - self.score_mean)
+        self.score_min = score if self.score_min is None else min(self.score_min, score)
+        self.score_max = score if self.score_max is None else max(self.score_max, score)
+
+        if exemplar and label in self._exemplars:
+            self._push_exemplar(label, score, prediction["text"])
+
+        if prediction.get("probs") is not None:
+            self._prob_block.append(prediction["probs"])
+            if len(self._prob_block) >= PROB_BLOCK_SIZE:
+                self._reduce_probs()
+
+        if self.results is not None:
+            self.results.append(prediction)
+
+    def _push_exemplar(self, label, score, text):
+        heap = self._exemplars[label]
+        self._seq += 1
+        entry = (score, -self._seq, text)
+        if len(heap) < self.top_k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    def _reduce_probs(self):
+        if not self._prob_block:
+            return
+        import numpy as np
+        from services.emotion_profile import entropy
+
+        block = np.vstack(self._prob_block).astype(np.float32)
+        self._prob_block = []
+        block_sum = block.sum(axis=0, dtype=np.float64)
+        self._prob_sum = block_sum if self._prob_sum is None else self._prob_sum + block_sum
+        self._prob_count += len(block)
+        self._entropy_sum += float(entropy(block).sum())
+
+    def emotion_profile(self):
+        """Mean emotion probabilities and entropies over comments that had a vector."""
+        self._reduce_probs()
+        if not self._prob_count:
+            return {}
+        from services.emotion_profile import profile_summary
+        return profile_summary(self._prob_sum, self._prob_count, self._entropy_sum)
+
+    def exemplars(self, label):
+        """Returns the top-k comment texts for `label`, most confident first."""
+        return [text for _, _, text in sorted(self._exemplars[label], reverse=True)]
+
+    def score_stats(self):
+        variance = self._score_m2 / self.score_count if self.score_count else 0.0
+        return {
+            "count": self.score_count,
+            "mean": round(self.score_mean, 4),
+            "std": round(math.sqrt(variance), 4),
+            "min": self.score_min,
+            "max": self.score_max,
+        }
+
+    def to_dict(self):
+        """Serializable partial state, for merging results from other workers."""
+        self._reduce_probs()
+        return {
+            "hope_count": self.hope_count,
+            "hate_count": self.hate_count,
+            "comments_processed": self.comments_processed,
+            "emotions": dict(self.emotions),
+            "score_count": self.score_count,
+            "score_mean": self.score_mean,
+            "score_m2": self._score_m2,
+            "score_min": self.score_min,
+            "score_max": self.score_max,
+            "prob_sum": self._prob_sum.tolist() if self._prob_sum is not None else None,
+            "prob_count": self._prob_count,
+            "entropy_sum": self._entropy_sum,
+            "exemplars": {
+                label: [[score, text] for score, _, text in sorted(heap, reverse=True)]
+                for label, heap in self._exemplars.items()
+            },
+        }
+
+    def merge(self, state):
+        """Folds in a partial state produced by another aggregator's `to_dict`."""
+        self.hope_count += state["hope_count"]
+        self.hate_count += state["hate_count"]
+        self.comments_processed += state["comments_processed"]
+        self.emotions.update(state["emotions"])
+
+        # Chan et al.'s pairwise update combines two Welford accumulators exactly.
+        count = state["score_count"]
+        if count:
+            total = self.score_count + count
+            delta = state["score_mean"] - self.score_mean
+            self.score_mean += delta * count / total
+            self._score_m2 += state["score_m2"] + delta * delta * self.score_count * count / total
+            self.score_count = total
+            for bound, pick in (("score_min", min), ("score_max", max)):
+                current = getattr(self, bound)
+                setattr(self, bound, state[bound] if current is None else pick(current, state[bound]))
+
+        if state.get("prob_count"):
+            import numpy as np
+            prob_sum = np.asarray(state["prob_sum"], dtype=np.float64)
+            self._prob_sum = prob_sum if self._prob_sum is None else self._prob_sum + prob_sum
+            self._prob_count += state["prob_count"]
+            self._entropy_sum += state["entropy_sum"]
+
+        for label, entries in state["exemplars"].items():
+            if label in self._exemplars:
+                for score, text in entries:
+                    self._push_exemplar(label, score, text)
+
+    def summary(self):
+        """Returns the aggregate in the shape `analyze_youtube_comments` reports."""
+        summary = {
+            "hope_count": self.hope_count,
+            "hate_count": self.hate_count,
+            "comments_processed": self.comments_processed,
+            "emotion_counts": dict(self.emotions),
+            "score_stats": self.score_stats(),
+            "hope_comments": self.exemplars("hope"),
+            "hate_comments": self.exemplars("hate"),
+        }
+        summary.update(self.emotion_profile())
+        if self.results is not None:
+            summary["results"] = self.results
+        return summary
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+Batch hope/hate analysis over many videos, a playlist or a whole channel.
+
+A batch job resolves its video IDs (a channel is resolved through its uploads
+playlist), then spreads the videos over a thread pool that shares the job's
+API quota budget. Every job is also charged to BATCH_DAILY_QUOTA, shared by
+all jobs and processes and recorded per UTC day in batch_quota_days. Each
+video takes an analysis governor slot under the user's batch ID, so batches
+queue behind the same CPU limit as interactive analyses, and a user can have
+at most BATCH_MAX_ACTIVE_PER_USER jobs active at once.
+
+Per-video progress and results are stored in the batch_jobs /
+batch_job_videos tables, so a job interrupted by a restart or an exhausted
+budget can be resumed and only the unfinished videos are redone. A lock file
+per job keeps two processes from running the same job.
+
+Command-line use (set YOUTUBE_FAKE_DATA to run against the local fake API):
+
+    python -m services.batch run --channel UC... --budget 500
+    python -m services.batch run --videos VIDEO_A VIDEO_B
+    python -m services.batch resume JOB_ID
+    python -m services.batch resume --all     # e.g. after a restart
+    python -m services.batch status JOB_ID
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from database import (
+    create_batch_job, add_batch_job_videos, update_batch_job,
+    update_batch_job_video, get_batch_job, get_unfinished_batch_jobs,
+    count_active_batch_jobs, charge_batch_daily_quota
+)
+from services.governor import MAX_CONCURRENT, analysis_governor, AdmissionRejected
+from services.quota import LIST_CALL_COST, QuotaBudget, QuotaExceeded
+
+# Concurrent videos per user's batches, across all of their jobs and worker
+# processes. Bounded by MAX_CONCURRENT, as more could never run at once.
+BATCH_WORKERS = max(1, min(int(os.environ.get("BATCH_WORKERS", MAX_CONCURRENT)), MAX_CONCURRENT))
+BATCH_QUOTA_BUDGET = int(os.environ.get("BATCH_QUOTA_BUDGET", "2000"))
+BATCH_DAILY_QUOTA = int(os.environ.get("BATCH_DAILY_QUOTA", "5000"))
+BATCH_MAX_VIDEOS = int(os.environ.get("BATCH_MAX_VIDEOS", "200"))
+BATCH_MAX_ACTIVE_PER_USER = int(os.environ.get("BATCH_MAX_ACTIVE_PER_USER", "2"))
+BATCH_LOCK_DIR = os.environ.get("BATCH_LOCK_DIR", os.path.join("instance", "batch_locks"))
+# Longest wait between attempts to get a governor slot for a batch video.
+BATCH_SLOT_RETRY_MAX = float(os.environ.get("BATCH_SLOT_RETRY_MAX", "30"))
+
+# Videos that still need work when a job is (re)started.
+_RESUMABLE_STATUSES = ("pending", "running", "paused")
+
+_active_jobs = set()
+_active_lock = threading.Lock()
+
+
+class DailyBatchQuota:
+    """Parent budget for every batch job: BATCH_DAILY_QUOTA units per UTC day."""
+
+    def __init__(self, limit=BATCH_DAILY_QUOTA):
+        self.limit = limit
+
+    def spend(self, units=LIST_CALL_COST):
+        if not charge_batch_daily_quota(units, self.limit):
+            raise QuotaExceeded(f"Daily batch quota budget of {self.limit} units exhausted.")
+
+
+daily_quota = DailyBatchQuota()
+
+# Batch identities get their own cap instead of the interactive per-user one.
+analysis_governor.set_prefix_limit("batch:", BATCH_WORKERS)
+
+
+def batch_user(user_id):
+    """Governor user ID for a user's batch analyses, separate from their interactive one."""
+    return f"batch:{user_id}"
+
+
+def overall_sentiment(hope_count, hate_count):
+    """Maps hope/hate counts to the Positive/Negative/Neutral label used in predictions."""
+    if hope_count > hate_count:
+        return 'Positive'
+    if hate_count > hope_count:
+        return 'Negative'
+    return 'Neutral'
+
+
+def resolve_video_ids(youtube, quota, channel_id=None, playlist_id=None, max_videos=BATCH_MAX_VIDEOS):
+    """Returns up to `max_videos` video IDs from a channel's uploads or a playlist."""
+    if channel_id:
+        quota.spend()
+        response = youtube.channels().list(part="contentDetails", id=channel_id).execute()
+        items = response.get("items", [])
+        if not items:
+            raise ValueError(f"Channel '{channel_id}' not found.")
+        playlist_id = items[0]["contentDetails"]["relatedPlaylists"]["uploads"]
+
+    video_ids = []
+    page_token = None
+    while len(video_ids) < max_videos:
+        quota.spend()
+        response = youtube.playlistItems().list(
+            part="contentDetails",
+            playlistId=playlist_id,
+            maxResults=50,
+            pageToken=page_token
+        ).execute()
+        for item in response.get("items", []):
+            video_id = item["contentDetails"]["videoId"]
+            if video_id not in video_ids:
+                video_ids.append(video_id)
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+    return video_ids[:max_videos]
+
+
+def start_batch_job(user_id, video_ids=None, channel_id=None, playlist_id=None,
+                    quota_budget=BATCH_QUOTA_BUDGET, background=True):
+    """
+    Creates a batch job for exactly one source and starts it. Returns the
+    job ID; with `background` the job runs in a daemon thread.
+    """
+    if video_ids is not None and not isinstance(video_ids, (list, tuple)):
+        raise ValueError("video_ids must be a list of video IDs or URLs.")
+    sources = [s for s in (video_ids, channel_id, playlist_id) if s]
+    if len(sources) != 1:
+        raise ValueError("Provide exactly one of video_ids, channel_id or playlist_id.")
+    check_active_limit(user_id)
+
+    job_id = uuid.uuid4().hex
+    if video_ids:
+        from services.youtube import extract_video_id
+        video_ids = list(dict.fromkeys(extract_video_id(str(v)) for v in video_ids if str(v).strip()))
+        if len(video_ids) > BATCH_MAX_VIDEOS:
+            raise ValueError(f"A batch can contain at most {BATCH_MAX_VIDEOS} videos.")
+        create_batch_job(job_id, user_id, 'videos', None, quota_budget)
+        add_batch_job_videos(job_id, video_ids)
+        update_batch_job(job_id, status='pending')
+    elif channel_id:
+        create_batch_job(job_id, user_id, 'channel', channel_id, quota_budget)
+    else:
+        create_batch_job(job_id, user_id, 'playlist', playlist_id, quota_budget)
+
+    if background:
+        threading.Thread(target=run_batch_job, args=(job_id,), name=f"batch-{job_id[:8]}", daemon=True).start()
+    else:
+        run_batch_job(job_id)
+    return job_id
+
+
+def compact_result(result):
+    """The part of an analysis result worth keeping per video."""
+    keys = ("hope_count", "hate_count", "comments_processed", "duplicates_collapsed",
+            "emotion_counts", "score_stats", "emotion_profile", "profile_entropy", "mean_entropy",
+            "hope_comments", "hate_comments")
+    return {key: result.get(key) for key in keys if key in result}
+
+
+def check_active_limit(user_id, exclude_job_id=None):
+    """Raises AdmissionRejected when the user already has their share of active jobs."""
+    if count_active_batch_jobs(user_id, exclude_job_id) >= BATCH_MAX_ACTIVE_PER_USER:
+        raise AdmissionRejected(
+            f"You already have {BATCH_MAX_ACTIVE_PER_USER} batch jobs running. "
+            "Please wait for one to finish.",
+            60
+        )
+
+
+def _governed_slot(user_id):
+    """
+    Waits for a governor slot for a batch analysis. Batches run in the
+    background, so a rejection is retried after its Retry-After hint.
+    """
+    while True:
+        try:
+            return analysis_governor.acquire(batch_user(user_id))
+        except AdmissionRejected as e:
+            time.sleep(min(e.retry_after, BATCH_SLOT_RETRY_MAX))
+
+
+def _analyze_video(job_id, user_id, video_id, quota):
+    from services.youtube import analyze_youtube_comments
+
+    token = _governed_slot(user_id)
+    update_batch_job_video(job_id, video_id, 'running')
+    try:
+        result = analyze_youtube_comments(video_id, quota=quota)
+    except Exception as e:
+        update_batch_job_video(job_id, video_id, 'failed', error=str(e))
+        return 'failed'
+    finally:
+        analysis_governor.release(token)
+        update_batch_job(job_id, quota_used=quota.used)
+
+    if result.get("quota_exhausted"):
+        # Partial counts are discarded; the video is redone on resume.
+        update_batch_job_video(job_id, video_id, 'paused', error=result["error"])
+        return 'paused'
+    if result.get("error"):
+        update_batch_job_video(job_id, video_id, 'failed', result=compact_result(result), error=result["error"])
+        return 'failed'
+    update_batch_job_video(job_id, video_id, 'completed', result=compact_result(result))
+    return 'completed'
+
+
+def _lock_job(job_id):
+    """
+    Takes the job's lock file so no other process runs it at the same time.
+    Returns the open file (None without fcntl), or False if it is taken.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    os.makedirs(BATCH_LOCK_DIR, exist_ok=True)
+    handle = open(os.path.join(BATCH_LOCK_DIR, f"{job_id}.lock"), "w")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    return handle
+
+
+def run_batch_job(job_id, workers=BATCH_WORKERS, add_quota=0):
+    """
+    Runs (or resumes) a batch job until every video is done or the quota
+    budget is spent. Safe to call again after a restart; `add_quota` raises
+    the budget of a job that was paused for running out of it.
+    """
+    with _active_lock:
+        if job_id in _active_jobs:
+            return
+        job_lock = _lock_job(job_id)
+        if job_lock is False:
+            print(f"ℹ️ Batch {job_id} is already running in another process.")
+            return
+        _active_jobs.add(job_id)
+
+    try:
+        job = get_batch_job(job_id)
+        if job is None:
+            raise ValueError(f"Batch job '{job_id}' not found.")
+
+        from services.youtube import get_youtube_client
+        youtube = get_youtube_client()
+        if not youtube:
+            update_batch_job(job_id, status='paused', error="YouTube API service is not available.")
+            return
+
+        if add_quota:
+            job['quota_budget'] += add_quota
+            update_batch_job(job_id, quota_budget=job['quota_budget'])
+        quota = QuotaBudget(job['quota_budget'], job['quota_used'], parent=daily_quota)
+
+        if job['source_type'] != 'videos' and not job['videos']:
+            try:
+                video_ids = resolve_video_ids(
+                    youtube, quota,
+                    channel_id=job['source_id'] if job['source_type'] == 'channel' else None,
+                    playlist_id=job['source_id'] if job['source_type'] == 'playlist' else None
+                )
+            except QuotaExceeded as e:
+                update_batch_job(job_id, status='paused', quota_used=quota.used, error=str(e))
+                return
+            except Exception as e:
+                update_batch_job(job_id, status='failed', quota_used=quota.used, error=f"Could not resolve videos: {e}")
+                return
+            add_batch_job_videos(job_id, video_ids)
+            job = get_batch_job(job_id)
+
+        pending = [v['video_id'] for v in job['videos'] if v['status'] in _RESUMABLE_STATUSES]
+        update_batch_job(job_id, status='running', quota_used=quota.used, error='')
+        print(f"--- Batch {job_id}: {len(pending)} of {len(job['videos'])} videos to analyse ---")
+
+        # The governor admits at most BATCH_WORKERS analyses per batch ID, so
+        # more threads than that would only wait for a slot.
+        workers = max(1, min(workers, analysis_governor.user_limit(batch_user(job['user_id']))))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"batch-{job_id[:8]}") as pool:
+            statuses = list(pool.map(lambda vid: _analyze_video(job_id, job['user_id'], vid, quota), pending))
+
+        final = 'paused' if 'paused' in statuses else 'completed'
+        update_batch_job(job_id, status=final, quota_used=quota.used)
+        print(f"--- Batch {job_id} {final}: quota used {quota.used}/{quota.limit} ---")
+    finally:
+        with _active_lock:
+            _active_jobs.discard(job_id)
+            if job_lock:
+                job_lock.close()
+
+
+def resume_unfinished_jobs():
+    """
+    Resumes every job left unfinished by a previous process, one after the
+    other. Jobs still running elsewhere are skipped by their lock file.
+    """
+    job_ids = get_unfinished_batch_jobs()
+    for job_id in job_ids:
+        run_batch_job(job_id)
+    return job_ids
+
+
+def batch_report(job):
+    """Builds the per-video and combined hope/hate report for a job row."""
+    combined = {"hope_count": 0, "hate_count": 0, "comments_processed": 0,
+                "duplicates_collapsed": 0, "emotion_counts": {}}
+    videos = []
+    completed = 0
+    for video in job['videos']:
+        result = video['result'] or {}
+        entry = {"video_id": video['video_id'], "status": video['status'], "error": video['error']}
+        if video['status'] == 'completed':
+            completed += 1
+            entry.update(result)
+            entry["sentiment"] = overall_sentiment(result.get("hope_count", 0), result.get("hate_count", 0))
+            for key in ("hope_count", "hate_count", "comments_processed", "duplicates_collapsed"):
+                combined[key] += result.get(key) or 0
+            for emotion, count in (result.get("emotion_counts") or {}).items():
+                combined["emotion_counts"][emotion] = combined["emotion_counts"].get(emotion, 0) + count
+        videos.append(entry)
+
+    combined["sentiment"] = overall_sentiment(combined["hope_count"], combined["hate_count"])
+    return {
+        "job_id": job['id'],
+        "status": job['status'],
+        "source_type": job['source_type'],
+        "source_id": job['source_id'],
+        "error": job['error'],
+        "quota": {"budget": job['quota_budget'], "used": job['quota_used']},
+        "progress": {"completed": completed, "total": len(videos)},
+        "combined": combined,
+        "videos": videos,
+    }
+
+
+def main(argv=None):
+    from database import init_db
+
+    parser = argparse.ArgumentParser(description="Batch hope/hate analysis over many videos.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Start a new batch job and wait for it.")
+    source = run.add_mutually_exclusive_group(required=True)
+    source.add_argument("--videos", nargs="+")
+    source.add_argument("--channel")
+    source.add_argument("--playlist")
+    run.add_argument("--budget", type=int, default=BATCH_QUOTA_BUDGET, help="API quota units to spend.")
+    run.add_argument("--user-id", type=int, default=0)
+
+    resume = sub.add_parser("resume", help="Resume an interrupted or paused job.")
+    target = resume.add_mutually_exclusive_group(required=True)
+    target.add_argument("job_id", nargs="?")
+    target.add_argument("--all", action="store_true", help="Resume every unfinished job.")
+    resume.add_argument("--add-budget", type=int, default=0, help="Extra API quota units to grant.")
+
+    status = sub.add_parser("status", help="Print a job's report as JSON.")
+    status.add_argument("job_id")
+
+    args = parser.parse_args(argv)
+    os.makedirs('instance', exist_ok=True)
+    init_db()
+
+    if args.command == "run":
+        job_id = start_batch_job(args.user_id, video_ids=args.videos, channel_id=args.channel,
+                                 playlist_id=args.playlist, quota_budget=args.budget, background=False)
+    elif args.command == "resume" and args.all:
+        job_ids = resume_unfinished_jobs()
+        print(json.dumps([batch_report(get_batch_job(job_id)) for job_id in job_ids], indent=2))
+        return 0
+    else:
+        job_id = args.job_id
+        if args.command == "resume":
+            run_batch_job(job_id, add_quota=args.add_budget)
+
+    job = get_batch_job(job_id)
+    if job is None:
+        print(f"Batch job '{job_id}' not found.", file=sys.stderr)
+        return 1
+    print(json.dumps(batch_report(job), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
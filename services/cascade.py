@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Cheap first stage of the emotion classifier cascade.
+
+A linear model over hashed character n-grams is distilled offline from the
+DistilBERT model's own labels. At prediction time `hate_classifier` asks this
+model first and only falls back to the transformer when its confidence is
+below CASCADE_THRESHOLD.
+
+Training and evaluation tooling (one comment per line in the input file):
+
+    python -m services.cascade train comments.txt
+    python -m services.cascade evaluate comments.txt --threshold 0.85
+"""
+import argparse
+import os
+import pickle
+import sys
+
+_SERVICE_DIR = os.path.dirname(__file__)
+CASCADE_MODEL_PATH = os.path.abspath(os.path.join(_SERVICE_DIR, "..", "models", "cascade_model.pkl"))
+
+# Minimum linear-model probability for a prediction to skip the transformer.
+CASCADE_THRESHOLD = float(os.environ.get("CASCADE_THRESHOLD", "0.9"))
+CASCADE_ENABLED = os.environ.get("CASCADE_ENABLED", "1") != "0"
+
+N_FEATURES = 2 ** 20
+
+cascade_model = None
+_cascade_load_attempted = False
+
+
+def build_vectorizer():
+    """Stateless hashed n-gram features, so no vocabulary needs to be stored."""
+    from sklearn.feature_extraction.text import HashingVectorizer
+    return HashingVectorizer(
+        analyzer="char_wb",
+        ngram_range=(2, 5),
+        n_features=N_FEATURES,
+        alternate_sign=False,
+        norm="l2",
+        lowercase=True,
+    )
+
+
+def load_cascade_model():
+    """
+    Lazy loads the distilled linear model. A missing file is not an error:
+    the cascade is simply disabled and every comment goes to the transformer.
+    """
+    global cascade_model, _cascade_load_attempted
+    if cascade_model is not None or _cascade_load_attempted:
+        return cascade_model
+    _cascade_load_attempted = True
+
+    if not os.path.isfile(CASCADE_MODEL_PATH):
+        print(f"ℹ️ No cascade model at '{CASCADE_MODEL_PATH}', using the transformer only.")
+        return None
+
+    try:
+        with open(CASCADE_MODEL_PATH, 'rb') as f:
+            cascade_model = pickle.load(f)
+        print("✅ Cascade linear model loaded.")
+    except Exception as e:
+        print(f"❌ Error loading cascade model: {e}")
+        cascade_model = None
+    return cascade_model
+
+
+def predict_cheap(text):
+    """
+    Returns (emotion, confidence, probabilities) from the linear model, or
+    None when the cascade is disabled or no model has been trained. The
+    probabilities are a float16 vector in EMOTION_LABELS order.
+    """
+    if not CASCADE_ENABLED:
+        return None
+    data = load_cascade_model()
+    if data is None:
+        return None
+    try:
+        features = data["vectorizer"].transform([text])
+        probabilities = data["classifier"].predict_proba(features)[0]
+        best = probabilities.argmax()
+        from services.emotion_profile import align
+        vector = align(data["classifier"].classes_, probabilities)
+        return data["classifier"].classes_[best], float(probabilities[best]), vector
+    except Exception as e:
+        print(f"❌ Error during cascade prediction: {e}")
+        return None
+
+
+def _read_comments(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _teacher_labels(texts):
+    """Labels texts with the full transformer model (the distillation teacher)."""
+    from services.hate_classifier import predict_transformer
+
+    labels = []
+    for i, text in enumerate(texts, 1):
+        labels.append(predict_transformer(text)["emotion"])
+        if i % 500 == 0:
+            print(f"...labelled {i}/{len(texts)} comments with the transformer")
+    return labels
+
+
+def train_cascade(texts, output_path=CASCADE_MODEL_PATH):
+    """
+    Distills the transformer into a hashed n-gram logistic regression and
+    saves it to `output_path`.
+    """
+    from sklearn.linear_model import SGDClassifier
+
+    labels = _teacher_labels(texts)
+    keep = [i for i, label in enumerate(labels) if label != "unknown"]
+    texts = [texts[i] for i in keep]
+    labels = [labels[i] for i in keep]
+    if len(set(labels)) < 2:
+        raise ValueError("Need at least two distinct teacher labels to train the cascade.")
+
+    vectorizer = build_vectorizer()
+    classifier = SGDClassifier(loss="log_loss", alpha=1e-6, max_iter=50, tol=1e-4, random_state=0)
+    classifier.fit(vectorizer.transform(texts), labels)
+
+    with open(output_path, 'wb') as f:
+        pickle.dump({"vectorizer": vectorizer, "classifier": classifier}, f)
+    print(f"✅ Cascade model trained on {len(texts)} comments and saved to '{output_path}'.")
+    return output_path
+
+
+def evaluate_cascade(texts, thresholds=None):
+    """
+    Compares the cascade with the full transformer on `texts`, once per
+    confidence threshold in `thresholds`.
+
+    Each report gives the share of comments handled by the linear model, its
+    accuracy on that share, and the end-to-end emotion and hope/hate agreement
+    of the cascade with the transformer.
+    """
+    from services.hate_classifier import HOPE_LABELS
+
+    global cascade_model, _cascade_load_attempted
+    if not thresholds:
+        thresholds = [CASCADE_THRESHOLD]
+
+    cascade_model, _cascade_load_attempted = None, False
+    if load_cascade_model() is None:
+        raise RuntimeError("No cascade model to evaluate; run 'train' first.")
+
+    teacher = _teacher_labels(texts)
+    pairs = [(predict_cheap(text), reference) for text, reference in zip(texts, teacher) if reference != "unknown"]
+    total = len(pairs)
+
+    reports = []
+    for threshold in thresholds:
+        cheap_handled = cheap_correct = emotion_agree = hope_hate_agree = 0
+        for cheap, reference in pairs:
+            if cheap is not None and cheap[1] >= threshold:
+                cheap_handled += 1
+                predicted = cheap[0]
+                cheap_correct += predicted == reference
+            else:
+                predicted = reference
+            emotion_agree += predicted == reference
+            hope_hate_agree += (predicted in HOPE_LABELS) == (reference in HOPE_LABELS)
+
+        reports.append({
+            "comments": total,
+            "threshold": threshold,
+            "cheap_path_share": cheap_handled / total if total else 0.0,
+            "cheap_path_accuracy": cheap_correct / cheap_handled if cheap_handled else 0.0,
+            "cascade_emotion_accuracy": emotion_agree / total if total else 0.0,
+            "cascade_hope_hate_accuracy": hope_hate_agree / total if total else 0.0,
+        })
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or evaluate the cheap-first classifier cascade.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="Distill the transformer into the linear model.")
+    train.add_argument("input", help="Text file with one comment per line.")
+    train.add_argument("--output", default=CASCADE_MODEL_PATH)
+
+    evaluate = sub.add_parser("evaluate", help="Report cascade accuracy against the transformer.")
+    evaluate.add_argument("input", help="Held-out text file with one comment per line.")
+    evaluate.add_argument("--threshold", type=float, nargs="*",
+                          help="One or more confidence thresholds to sweep.")
+
+    args = parser.parse_args(argv)
+    texts = _read_comments(args.input)
+
+    if args.command == "train":
+        train_cascade(texts, args.output)
+        return 0
+
+    for report in evaluate_cascade(texts, args.threshold):
+        print(
+            f"threshold={report['threshold']:.2f} "
+            f"cheap_share={report['cheap_path_share']:.1%} "
+            f"cheap_acc={report['cheap_path_accuracy']:.1%} "
+            f"emotion_acc={report['cascade_emotion_accuracy']:.1%} "
+            f"hope_hate_acc={report['cascade_hope_hate_accuracy']:.1%} "
+            f"(n={report['comments']})"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Collapses exact and near-duplicate comments so that copy-pasted spam and bot
+floods only go through the classifier once.
+
+Comments are normalised (case, emoji, punctuation and whitespace removed) and
+grouped by exact match first. Anything left is compared with MinHash signatures
+over character shingles, bucketed with LSH so a new comment is only checked
+against a handful of candidates instead of every comment seen so far. Comments
+shorter than MIN_LSH_LENGTH are matched exactly only: a one-character edit
+already changes too many of their few shingles to reach the threshold.
+
+Signatures are computed with numpy: the shingles are hashed into a uint64
+array with a rolling polynomial hash, and all NUM_PERM permutations
+`(a * h + b) mod p` are applied at once with a 31-bit prime, so the products
+fit in uint64 and the minimum is taken over the whole matrix in one call.
+"""
+import random
+import re
+
+import numpy as np
+
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SIMILARITY_THRESHOLD = 0.8
+MIN_LSH_LENGTH = 20
+# Caps the index so memory stays flat on very large videos; once full, new
+# comments are still matched against existing clusters but not indexed.
+MAX_CLUSTERS = 50000
+# Caps the exact-match memo of near-duplicate variants for the same reason;
+# once full, further variants are still found through the LSH probe.
+MAX_VARIANTS = 2 * MAX_CLUSTERS
+
+# Stand-in prediction for a cluster of comments the caller chose not to
+# classify (e.g. not English), so its copies are skipped without re-checking.
+SKIPPED = "skipped"
+
+_PRIME = (1 << 31) - 1
+_ROLL_BASE = np.uint64(1000003)
+
+# Fixed seed so signatures are stable between runs and worker processes.
+_rng = random.Random(1337)
+_PERM_A = np.array([_rng.randint(1, _PRIME - 1) for _ in range(NUM_PERM)], dtype=np.uint64)[:, None]
+_PERM_B = np.array([_rng.randint(0, _PRIME - 1) for _ in range(NUM_PERM)], dtype=np.uint64)[:, None]
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_comment(text):
+    """Lowercases text and strips emoji, punctuation and repeated whitespace."""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def _shingle_hashes(normalized):
+    """Distinct hashes (below the 31-bit prime) of a normalised comment's character shingles."""
+    codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    windows = max(1, len(codes) - SHINGLE_SIZE + 1)
+    hashes = np.zeros(windows, dtype=np.uint64)
+    for offset in range(min(SHINGLE_SIZE, len(codes))):
+        hashes = hashes * _ROLL_BASE + codes[offset:offset + windows]
+    # splitmix64 finaliser, so neighbouring shingles spread over the range.
+    hashes ^= hashes >> np.uint64(30)
+    hashes *= np.uint64(0xBF58476D1CE4E5B9)
+    hashes ^= hashes >> np.uint64(27)
+    return np.unique(hashes % np.uint64(_PRIME))
+
+
+def minhash_signature(normalized):
+    """Computes the MinHash signature of a normalised comment."""
+    hashes = _shingle_hashes(normalized)
+    return tuple(((_PERM_A * hashes + _PERM_B) % np.uint64(_PRIME)).min(axis=1).tolist())
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimates the Jaccard similarity of two comments from their signatures."""
+    matches = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return matches / float(NUM_PERM)
+
+
+class CommentDeduplicator:
+    """
+    Streaming duplicate index for the comments of one video.
+
+    `lookup` returns the prediction already made for an equivalent comment (or
+    None), and `add` registers a newly classified comment as the representative
+    of its cluster. Cluster sizes are tracked so callers can weight results.
+    A cluster added with the SKIPPED prediction is returned as such by
+    `lookup` but does not count towards `collapsed`.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_clusters=MAX_CLUSTERS,
+                 max_variants=MAX_VARIANTS):
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self.max_variants = max_variants
+        self._exact = {}
+        self._buckets = {}
+        self._representatives = []
+        self._pending = None
+        self.collapsed = 0
+
+    def _bands(self, signature):
+        for band in range(LSH_BANDS):
+            start = band * LSH_ROWS
+            yield band, signature[start:start + LSH_ROWS]
+
+    def _key(self, text):
+        normalized = normalize_comment(text)
+        if len(normalized) < MIN_LSH_LENGTH:
+            return normalized, None
+        return normalized, minhash_signature(normalized)
+
+    def lookup(self, text):
+        """
+        Returns (cluster_id, prediction) for a known duplicate of `text`, or
+        (None, None) when it has not been seen yet. The signature computed for
+        an unseen comment is kept so the following `add` can reuse it.
+        """
+        normalized = normalize_comment(text)
+        cluster_id = self._exact.get(normalized)
+        if cluster_id is None and len(normalized) < MIN_LSH_LENGTH:
+            self._pending = (normalized, None)
+            return None, None
+        if cluster_id is None:
+            signature = minhash_signature(normalized)
+            self._pending = (normalized, signature)
+            candidates = set()
+            for band_key in self._bands(signature):
+                candidates.update(self._buckets.get(band_key, ()))
+            best = None
+            for candidate in candidates:
+                similarity = estimate_similarity(signature, self._representatives[candidate]["signature"])
+                if similarity >= self.threshold and (best is None or similarity > best[0]):
+                    best = (similarity, candidate)
+            if best is None:
+                return None, None
+            cluster_id = best[1]
+            # Later exact copies of this variant skip the LSH probe entirely.
+            if len(self._exact) < self.max_variants:
+                self._exact[normalized] = cluster_id
+        else:
+            self._pending = None
+
+        cluster = self._representatives[cluster_id]
+        cluster["size"] += 1
+        if cluster["prediction"] != SKIPPED:
+            self.collapsed += 1
+        return cluster_id, cluster["prediction"]
+
+    def add(self, text, prediction):
+        """
+        Registers a classified comment as the representative of a new cluster.
+        Returns None without indexing it once `max_clusters` is reached.
+        """
+        if len(self._representatives) >= self.max_clusters:
+            self._pending = None
+            return None
+
+        pending = self._pending
+        if pending is None or pending[0] != normalize_comment(text):
+            pending = self._key(text)
+        normalized, signature = pending
+        self._pending = None
+
+        cluster_id = len(self._representatives)
+        self._representatives.append({
+            "signature": signature,
+            "prediction": prediction,
+            "size": 1,
+        })
+        self._exact[normalized] = cluster_id
+        if signature is not None:
+            for band_key in self._bands(signature):
+                self._buckets.setdefault(band_key, []).append(cluster_id)
+        return cluster_id
+
+    @property
+    def clusters(self):
+        """Number of distinct clusters (classified or skipped) seen so far."""
+        return len(self._representatives)
+
+    def cluster_sizes(self):
+        """Returns the size of every cluster, indexed by cluster id."""
+        return [cluster["size"] for cluster in self._representatives]
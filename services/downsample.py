@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized downsampling for long tracker series.
+
+* `lttb` (Largest-Triangle-Three-Buckets) picks the samples that preserve the
+  visual shape of a series, for plotting.
+* `rollup` aggregates a series into min/max/mean per time bucket, for storage.
+* `target_points` / `rollup_bucket` size both from the plot width and the
+  time range being shown.
+* `add_velocity` derives per-minute rates with vectorized differences.
+"""
+import numpy as np
+import pandas as pd
+
+# Pixels per plotted point below which extra samples are invisible anyway.
+PIXELS_PER_POINT = 2
+MIN_POINTS = 3
+
+# Candidate rollup buckets, smallest first.
+ROLLUP_BUCKETS = ["1min", "5min", "15min", "30min", "1h", "3h", "6h", "12h", "1D"]
+
+
+def target_points(width_px, n_samples, time_range=None, sample_interval=None):
+    """
+    Returns how many points to draw for a series of `n_samples` in a plot
+    `width_px` wide. When the time range and nominal sample interval are
+    known, the count is also capped at the samples that range can hold.
+    """
+    points = max(MIN_POINTS, int(width_px) // PIXELS_PER_POINT)
+    if time_range is not None and sample_interval:
+        expected = int(pd.Timedelta(time_range) / pd.Timedelta(sample_interval)) + 1
+        points = min(points, max(MIN_POINTS, expected))
+    return min(points, n_samples)
+
+
+def lttb(x, y, n_out):
+    """
+    Returns the indices of the `n_out` samples LTTB keeps from (x, y).
+    `x` must be sorted; NaN values in `y` should be filled beforehand.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < MIN_POINTS:
+        return np.arange(n)
+
+    # Bucket boundaries for the interior points (first and last are always kept).
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average point of every bucket, computed in one pass.
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[1:n - 1], starts - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], starts - 1) / counts
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = starts[i], ends[i]
+        # The third triangle vertex is the next bucket's average (or the last point).
+        if i + 1 < n_out - 2:
+            next_x, next_y = avg_x[i + 1], avg_y[i + 1]
+        else:
+            next_x, next_y = x[-1], y[-1]
+        px, py = x[previous], y[previous]
+        areas = np.abs(
+            (px - next_x) * (y[start:end] - py) - (px - x[start:end]) * (next_y - py)
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def downsample_frame(df, time_column, value_column, n_out):
+    """Returns the rows of `df` that LTTB keeps for `value_column`."""
+    if len(df) <= n_out:
+        return df
+    x = df[time_column].astype("int64").to_numpy()
+    y = df[value_column].ffill().bfill().to_numpy()
+    return df.iloc[lttb(x, y, n_out)]
+
+
+def rollup_bucket(time_range, max_buckets):
+    """Smallest bucket from ROLLUP_BUCKETS that covers `time_range` in `max_buckets`."""
+    time_range = pd.Timedelta(time_range)
+    for bucket in ROLLUP_BUCKETS:
+        if time_range / pd.Timedelta(bucket) <= max_buckets:
+            return bucket
+    return ROLLUP_BUCKETS[-1]
+
+
+def rollup(df, time_column, value_columns, bucket):
+    """
+    Aggregates `value_columns` into min/max/mean per `bucket`. The result has
+    one row per non-empty bucket and columns like `views_min`, `views_mean`.
+    """
+    grouped = df.set_index(time_column)[value_columns].resample(bucket)
+    out = grouped.agg(["min", "max", "mean"])
+    out.columns = [f"{column}_{stat}" for column, stat in out.columns]
+    return out.dropna(how="all").reset_index()
+
+
+def add_velocity(df, time_column, value_columns, per="1min"):
+    """
+    Adds `<column>_per_min`-style rate columns (change per `per`) computed with
+    vectorized differences over the whole frame.
+    """
+    seconds = df[time_column].diff().dt.total_seconds().to_numpy()
+    scale = pd.Timedelta(per).total_seconds()
+    suffix = "per_min" if per == "1min" else f"per_{per}"
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for column in value_columns:
+            delta = df[column].diff().to_numpy()
+            rate = np.where(seconds > 0, delta / seconds * scale, np.nan)
+            df[f"{column}_{suffix}"] = rate
+    return df
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Per-comment emotion probability vectors and vectorized aggregation over them.
+
+The classifier keeps its whole softmax over EMOTION_LABELS as a float16
+array (12 bytes per comment), which is stored with the prediction. Anything
+derived from the argmax can then be recomputed from the stored vectors
+without running the model again:
+
+* the mean emotion profile of a video and its entropy,
+* hope/hate counts under a different HOPE_LABELS mapping,
+* hope/hate counts with a probability threshold instead of the argmax.
+
+    python -m services.emotion_profile VIDEO_ID --hope joy love --threshold 0.6
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from services.hate_classifier import EMOTION_LABELS, HOPE_LABELS
+
+PROB_DTYPE = np.float16
+VECTOR_BYTES = len(EMOTION_LABELS) * np.dtype(PROB_DTYPE).itemsize
+
+
+def to_vector(probabilities):
+    """Compact float16 copy of a probability vector ordered like EMOTION_LABELS."""
+    return np.asarray(probabilities, dtype=PROB_DTYPE)
+
+
+def align(classes, probabilities):
+    """
+    Reorders a classifier's `predict_proba` row (ordered by `classes`) into
+    EMOTION_LABELS order; emotions the classifier never saw get 0.
+    """
+    vector = np.zeros(len(EMOTION_LABELS), dtype=np.float32)
+    index = {label: i for i, label in enumerate(EMOTION_LABELS)}
+    for label, p in zip(classes, probabilities):
+        if label in index:
+            vector[index[label]] = p
+    return to_vector(vector)
+
+
+def from_blobs(blobs):
+    """Decodes stored vectors into an (n, len(EMOTION_LABELS)) float32 matrix in one pass."""
+    data = b"".join(blobs)
+    return np.frombuffer(data, dtype=PROB_DTYPE).reshape(-1, len(EMOTION_LABELS)).astype(np.float32)
+
+
+def entropy(matrix):
+    """Shannon entropy (nats) of each row of a probability matrix."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(matrix > 0, matrix * np.log(matrix), 0.0)
+    return -terms.sum(axis=-1)
+
+
+def hope_mask(hope_labels=None):
+    """Boolean mask over EMOTION_LABELS for the emotions counted as Hope."""
+    hope_labels = HOPE_LABELS if hope_labels is None else set(hope_labels)
+    unknown = set(hope_labels) - set(EMOTION_LABELS)
+    if unknown:
+        raise ValueError(f"Unknown emotion(s): {', '.join(sorted(unknown))}")
+    return np.array([label in hope_labels for label in EMOTION_LABELS])
+
+
+def label_counts(matrix, hope_labels=None, threshold=None):
+    """
+    Hope/hate counts for a probability matrix. By default a comment is Hope
+    when its top emotion is in `hope_labels`, as in `predict_hope_hate`; with
+    `threshold`, it is Hope when its hope emotions' total probability reaches
+    the threshold.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    mask = hope_mask(hope_labels)
+    if threshold is None:
+        is_hope = mask[matrix.argmax(axis=1)]
+    else:
+        is_hope = matrix[:, mask].sum(axis=1) >= threshold
+    hope = int(is_hope.sum())
+    return {"hope_count": hope, "hate_count": int(len(matrix) - hope)}
+
+
+def profile_summary(prob_sum, count, entropy_sum):
+    """Mean emotion profile and entropies from running sums (see CommentAggregator)."""
+    if not count:
+        return {}
+    mean = np.asarray(prob_sum, dtype=np.float64) / count
+    return {
+        "emotion_profile": {label: round(float(p), 4) for label, p in zip(EMOTION_LABELS, mean)},
+        "profile_entropy": round(float(entropy(mean)), 4),
+        "mean_entropy": round(entropy_sum / count, 4),
+    }
+
+
+def summarize(matrix, hope_labels=None, threshold=None):
+    """Counts, mean profile and entropies for a whole matrix of vectors."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    summary = {"comments": len(matrix)}
+    summary.update(label_counts(matrix, hope_labels, threshold))
+    summary.update(profile_summary(matrix.sum(axis=0), len(matrix), float(entropy(matrix).sum())))
+    return summary
+
+
+def relabel_video(video_id, hope_labels=None, threshold=None):
+    """
+    Recomputes a video's hope/hate counts and emotion profile from the
+    vectors stored in comment_predictions, without running the classifier.
+    """
+    from database import get_comment_probabilities
+
+    blobs, missing = get_comment_probabilities(video_id)
+    summary = summarize(from_blobs(blobs), hope_labels, threshold)
+    summary.update({
+        "video_id": video_id,
+        "hope_labels": sorted(HOPE_LABELS if hope_labels is None else hope_labels),
+        "threshold": threshold,
+        "without_vectors": missing,
+    })
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute hope/hate counts from stored emotion vectors.")
+    parser.add_argument("video_id")
+    parser.add_argument("--hope", nargs="+", choices=EMOTION_LABELS, help="Emotions counted as Hope.")
+    parser.add_argument("--threshold", type=float, help="Hope when the hope emotions' total probability reaches this.")
+    args = parser.parse_args(argv)
+
+    print(json.dumps(relabel_video(args.video_id, args.hope, args.threshold), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
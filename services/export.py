@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming export of per-comment predictions as NDJSON, CSV or Parquet.
+
+Every encoder takes an iterable of prediction rows and yields encoded chunks as
+soon as they are ready, so an export starts sending bytes immediately and its
+memory use does not grow with the number of comments. The first row is sent
+on its own (the first Parquet row group is small), and later chunks are also
+cut after FLUSH_SECONDS. Slow classification therefore never leaves the
+response idle long enough for a proxy to time it out.
+
+Command-line use:
+
+    python -m services.export VIDEO_ID --format csv --output comments.csv
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import sys
+import time
+
+EXPORT_FIELDS = ["comment_id", "text", "emotion", "hope_hate", "score"]
+
+# Rows per chunk handed to the HTTP response / output file.
+CHUNK_ROWS = 500
+PARQUET_ROW_GROUP = 10000
+FIRST_PARQUET_ROW_GROUP = 100
+# A chunk with any rows in it is sent after this long, whatever its size.
+FLUSH_SECONDS = 2.0
+
+
+def _project(row):
+    return {field: row.get(field) for field in EXPORT_FIELDS}
+
+
+def _batches(rows, size, first_size=1, flush_seconds=FLUSH_SECONDS):
+    """
+    Groups rows into lists: the first of `first_size` rows, then `size` rows
+    each, cut early once `flush_seconds` have passed since the last batch.
+    """
+    batch = []
+    limit = first_size
+    last_flush = time.monotonic()
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= limit or time.monotonic() - last_flush >= flush_seconds:
+            yield batch
+            batch = []
+            limit = size
+            last_flush = time.monotonic()
+    if batch:
+        yield batch
+
+
+def iter_ndjson(rows, chunk_rows=CHUNK_ROWS):
+    """Yields newline-delimited JSON, up to `chunk_rows` records per chunk."""
+    for batch in _batches(rows, chunk_rows):
+        lines = [json.dumps(_project(row), ensure_ascii=False) for row in batch]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def iter_csv(rows, chunk_rows=CHUNK_ROWS):
+    """Yields CSV: the header row at once, then up to `chunk_rows` records per chunk."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    yield buffer.getvalue().encode("utf-8")
+    for batch in _batches(rows, chunk_rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_parquet(rows, row_group_rows=PARQUET_ROW_GROUP):
+    """
+    Returns a generator yielding a Parquet file one row group at a time, so
+    memory is bounded by a single row group. Requires `pyarrow`; a missing
+    install raises RuntimeError before any bytes are produced.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package.")
+    return _parquet_chunks(pa, pq, rows, row_group_rows)
+
+
+def _parquet_chunks(pa, pq, rows, row_group_rows):
+    schema = pa.schema([
+        ("comment_id", pa.string()),
+        ("text", pa.string()),
+        ("emotion", pa.string()),
+        ("hope_hate", pa.string()),
+        ("score", pa.float32()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+
+    def _flush(columns):
+        writer.write_table(pa.table(columns, schema=schema))
+        return sink.drain()
+
+    first_size = min(FIRST_PARQUET_ROW_GROUP, row_group_rows)
+    try:
+        for batch in _batches(rows, row_group_rows, first_size):
+            yield _flush({field: [row.get(field) for row in batch] for field in EXPORT_FIELDS})
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+# format -> (encoder, mimetype, file extension)
+EXPORT_FORMATS = {
+    "ndjson": (iter_ndjson, "application/x-ndjson", "ndjson"),
+    "csv": (iter_csv, "text/csv", "csv"),
+    "parquet": (iter_parquet, "application/vnd.apache.parquet", "parquet"),
+}
+
+
+def export_predictions(rows, fmt):
+    """Returns (chunk generator, mimetype, extension) for `fmt`."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}'. Choose one of: {', '.join(EXPORT_FORMATS)}.")
+    encoder, mimetype, extension = EXPORT_FORMATS[fmt]
+    return encoder(rows), mimetype, extension
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream per-comment predictions for a YouTube video.")
+    parser.add_argument("video", help="YouTube video ID or URL.")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--output", "-o", help="Output file (defaults to stdout).")
+    parser.add_argument("--no-dedup", action="store_true", help="Classify every comment, including duplicates.")
+    args = parser.parse_args(argv)
+
+    from services.youtube import extract_video_id, iter_comment_predictions
+
+    rows = iter_comment_predictions(extract_video_id(args.video), dedup=not args.no_dedup)
+    chunks, _, _ = export_predictions(rows, args.format)
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        # Progress messages go to stderr so they never end up in the export.
+        with contextlib.redirect_stdout(sys.stderr):
+            for chunk in chunks:
+                out.write(chunk)
+                out.flush()
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
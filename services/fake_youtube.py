@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the YouTube Data API client, used for development, batch
+testing and load tests without network access or quota.
+
+It mirrors the subset of `googleapiclient` calls this app makes
+(`commentThreads`, `channels`, `playlistItems`, `videos`) and serves them from
+a JSON fixture file. Point YOUTUBE_FAKE_DATA at the file to use it instead of
+the real API:
+
+    {
+      "videos": {
+        "VIDEO_ID": {
+          "channelId": "CHANNEL_ID",
+          "statistics": {"viewCount": "100", "likeCount": "5"},
+          "comments": [{"id": "c1", "text": "Great video!"}]
+        }
+      },
+      "channels": {
+        "CHANNEL_ID": {"uploads": "PLAYLIST_ID", "statistics": {"subscriberCount": "10"}}
+      },
+      "playlists": {"PLAYLIST_ID": ["VIDEO_ID"]}
+    }
+
+YOUTUBE_FAKE_LATENCY (seconds) adds a delay to every call.
+"""
+import json
+import os
+import time
+
+FAKE_LATENCY = float(os.environ.get("YOUTUBE_FAKE_LATENCY", "0"))
+
+
+class FakeHttpError(Exception):
+    """Raised for unknown IDs, like googleapiclient's HttpError 404."""
+
+    def __init__(self, message, status=404):
+        super().__init__(message)
+        self.status = status
+
+
+class _Request:
+    def __init__(self, func):
+        self._func = func
+
+    def execute(self):
+        if FAKE_LATENCY:
+            time.sleep(FAKE_LATENCY)
+        return self._func()
+
+
+def _page(items, page_token, page_size):
+    start = int(page_token or 0)
+    end = start + page_size
+    response = {"items": items[start:end], "pageInfo": {"totalResults": len(items)}}
+    if end < len(items):
+        response["nextPageToken"] = str(end)
+    return response
+
+
+class _Resource:
+    def __init__(self, data):
+        self._data = data
+
+
+class _CommentThreads(_Resource):
+    def list(self, part=None, videoId=None, maxResults=20, pageToken=None, **kwargs):
+        def run():
+            video = self._data["videos"].get(videoId)
+            if video is None:
+                raise FakeHttpError(f"Video '{videoId}' not found.")
+            items = [
+                {
+                    "id": comment["id"],
+                    "snippet": {
+                        "videoId": videoId,
+                        "topLevelComment": {
+                            "id": comment["id"],
+                            "snippet": {"textDisplay": comment["text"]},
+                        },
+                    },
+                }
+                for comment in video.get("comments", [])
+            ]
+            return _page(items, pageToken, min(int(maxResults), 100))
+        return _Request(run)
+
+
+class _Channels(_Resource):
+    def list(self, part=None, id=None, **kwargs):
+        def run():
+            channel = self._data["channels"].get(id)
+            if channel is None:
+                return {"items": []}
+            return {"items": [{
+                "id": id,
+                "contentDetails": {"relatedPlaylists": {"uploads": channel.get("uploads")}},
+                "statistics": channel.get("statistics", {}),
+            }]}
+        return _Request(run)
+
+
+class _PlaylistItems(_Resource):
+    def list(self, part=None, playlistId=None, maxResults=50, pageToken=None, **kwargs):
+        def run():
+            video_ids = self._data["playlists"].get(playlistId)
+            if video_ids is None:
+                raise FakeHttpError(f"Playlist '{playlistId}' not found.")
+            items = [{"contentDetails": {"videoId": vid}} for vid in video_ids]
+            return _page(items, pageToken, min(int(maxResults), 50))
+        return _Request(run)
+
+
+class _Videos(_Resource):
+    def list(self, part=None, id=None, **kwargs):
+        def run():
+            items = []
+            for vid in (id or "").split(","):
+                video = self._data["videos"].get(vid)
+                if video is not None:
+                    items.append({
+                        "id": vid,
+                        "snippet": {"channelId": video.get("channelId")},
+                        "statistics": video.get("statistics", {}),
+                    })
+            return {"items": items}
+        return _Request(run)
+
+
+class FakeYouTube:
+    """Drop-in for the object returned by googleapiclient.discovery.build."""
+
+    def __init__(self, data):
+        self._data = {
+            "videos": data.get("videos", {}),
+            "channels": data.get("channels", {}),
+            "playlists": data.get("playlists", {}),
+        }
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def commentThreads(self):
+        return _CommentThreads(self._data)
+
+    def channels(self):
+        return _Channels(self._data)
+
+    def playlistItems(self):
+        return _PlaylistItems(self._data)
+
+    def videos(self):
+        return _Videos(self._data)
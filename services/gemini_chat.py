@@ -1,5 +1,4 @@
 import os
-from google import genai
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -75,6 +74,8 @@ def get_client():
     if not api_key:
         print("Warning: GEMINI_API_KEY environment variable is missing.")
         return None
+    # Imported lazily: the Gemini SDK is slow to import and only needed for chat.
+    from google import genai
     return genai.Client(api_key=api_key)
 
 def chatbot(prompt: str) -> str:
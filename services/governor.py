@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Admission control for CPU-bound comment analysis.
+
+Only a limited number of analyses run at once in each worker process, each with
+a fixed torch thread budget, so concurrent requests share the cores instead of
+oversubscribing them. Requests over the limit wait in a bounded FIFO queue;
+when the queue is full (or a user already holds their share of slots) they are
+rejected straight away with a Retry-After hint, which the routes turn into 429.
+
+The per-user cap holds across worker processes: each admitted analysis holds
+an flock on one of the user's ANALYSIS_MAX_PER_USER lock files, and the locks
+are dropped by the OS if a worker dies. Slots and the queue stay per process.
+Every running or waiting analysis also holds a shared lock on ACTIVE_LOCK in
+the same directory, so background work in any process can tell whether a
+user analysis is in flight anywhere on the host.
+
+All limits are read from the environment:
+
+    ANALYSIS_MAX_CONCURRENT   analyses running at once per worker process
+    ANALYSIS_MAX_QUEUE        analyses allowed to wait for a slot
+    ANALYSIS_MAX_PER_USER     running + waiting analyses per user
+    ANALYSIS_QUEUE_TIMEOUT    seconds a queued analysis waits before giving up
+    ANALYSIS_TORCH_THREADS    intra-op threads per analysis
+    ANALYSIS_LOCK_DIR         directory of the per-user lock files
+    WEB_CONCURRENCY           worker processes sharing the machine (gunicorn)
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+CPU_COUNT = os.cpu_count() or 1
+WORKER_PROCESSES = _env_int("WEB_CONCURRENCY", 1)
+# Cores this worker process may use, given the others on the machine.
+CORES_PER_WORKER = max(1, CPU_COUNT // WORKER_PROCESSES)
+
+MAX_CONCURRENT = _env_int("ANALYSIS_MAX_CONCURRENT", max(1, CORES_PER_WORKER // 2))
+MAX_QUEUE = _env_int("ANALYSIS_MAX_QUEUE", 2 * MAX_CONCURRENT)
+MAX_PER_USER = _env_int("ANALYSIS_MAX_PER_USER", 1)
+QUEUE_TIMEOUT = float(os.environ.get("ANALYSIS_QUEUE_TIMEOUT", "120"))
+TORCH_THREADS = _env_int("ANALYSIS_TORCH_THREADS", max(1, CORES_PER_WORKER // MAX_CONCURRENT))
+LOCK_DIR = os.environ.get("ANALYSIS_LOCK_DIR", os.path.join("instance", "analysis_locks"))
+
+ACTIVE_LOCK = "active.lock"
+
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class AdmissionRejected(Exception):
+    """Raised when an analysis cannot be admitted; carries a Retry-After hint."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AnalysisGovernor:
+    """Bounded concurrency + bounded FIFO queue + per-user cap."""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE,
+                 max_per_user=MAX_PER_USER, queue_timeout=QUEUE_TIMEOUT, lock_dir=LOCK_DIR):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        # User-ID prefix -> per-identity cap used instead of max_per_user.
+        self._prefix_limits = {}
+        self.queue_timeout = queue_timeout
+        self.lock_dir = lock_dir
+        self.running = 0
+        self._queue = deque()
+        self._per_user = {}
+        self._cond = threading.Condition()
+        # Exponential moving average of analysis duration, for Retry-After.
+        self._avg_duration = 30.0
+
+    def _retry_after(self):
+        backlog = len(self._queue) + self.running
+        estimate = self._avg_duration * backlog / float(self.max_concurrent)
+        return max(1, int(round(estimate)))
+
+    def set_prefix_limit(self, prefix, limit):
+        """Caps identities starting with `prefix` (e.g. "batch:") at `limit` instead of max_per_user."""
+        self._prefix_limits[prefix] = max(1, int(limit))
+
+    def user_limit(self, user_id):
+        """Running + waiting analyses allowed for `user_id`."""
+        user_id = str(user_id)
+        for prefix, limit in self._prefix_limits.items():
+            if user_id.startswith(prefix):
+                return limit
+        return self.max_per_user
+
+    def _lock_user_slot(self, user_id):
+        """
+        Takes an flock on one of the user's lock files, shared by every worker
+        process. Returns the open file (None without fcntl), or False when all
+        of the user's slots are held elsewhere.
+        """
+        try:
+            import fcntl
+        except ImportError:
+            return None
+        os.makedirs(self.lock_dir, exist_ok=True)
+        name = _UNSAFE_NAME.sub("_", str(user_id))
+        for n in range(self.user_limit(user_id)):
+            handle = open(os.path.join(self.lock_dir, f"{name}.{n}.lock"), "w")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return handle
+            except OSError:
+                handle.close()
+        return False
+
+    def _hold_active(self):
+        """Shared flock on ACTIVE_LOCK, held while an analysis runs or waits (None without fcntl)."""
+        try:
+            import fcntl
+        except ImportError:
+            return None
+        os.makedirs(self.lock_dir, exist_ok=True)
+        handle = open(os.path.join(self.lock_dir, ACTIVE_LOCK), "w")
+        fcntl.flock(handle, fcntl.LOCK_SH)
+        return handle
+
+    def _active_elsewhere(self):
+        """True while any process sharing lock_dir holds ACTIVE_LOCK for an analysis."""
+        try:
+            import fcntl
+        except ImportError:
+            return False
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with open(os.path.join(self.lock_dir, ACTIVE_LOCK), "w") as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+        return False
+
+    def acquire(self, user_id):
+        """
+        Blocks until a slot is free and returns a token for `release`.
+        Raises AdmissionRejected if the user is over their share, the queue is
+        full, or the wait exceeds the queue timeout.
+        """
+        with self._cond:
+            if self._per_user.get(user_id, 0) >= self.user_limit(user_id):
+                raise AdmissionRejected(
+                    "You already have an analysis in progress. Please wait for it to finish.",
+                    self._retry_after()
+                )
+            if self.running >= self.max_concurrent and len(self._queue) >= self.max_queue:
+                raise AdmissionRejected(
+                    "The server is busy analysing other videos. Please try again shortly.",
+                    self._retry_after()
+                )
+            user_lock = self._lock_user_slot(user_id)
+            if user_lock is False:
+                raise AdmissionRejected(
+                    "You already have an analysis in progress. Please wait for it to finish.",
+                    self._retry_after()
+                )
+            locks = (user_lock, self._hold_active())
+
+            ticket = object()
+            self._queue.append(ticket)
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+            deadline = time.monotonic() + self.queue_timeout
+            while self.running >= self.max_concurrent or self._queue[0] is not ticket:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(ticket)
+                    self._release_user(user_id, locks)
+                    self._cond.notify_all()
+                    raise AdmissionRejected(
+                        "Timed out waiting for a free analysis slot. Please try again shortly.",
+                        self._retry_after()
+                    )
+                self._cond.wait(remaining)
+
+            self._queue.popleft()
+            self.running += 1
+            # The next ticket in line may be able to start too.
+            self._cond.notify_all()
+        return (user_id, time.monotonic(), locks)
+
+    def try_acquire_spare(self, user_id, reserve=1):
+        """
+        Non-blocking acquire for background work. Returns a token only when no
+        analysis is running or waiting in any process sharing lock_dir and at
+        least `reserve` of this process's slots stay free afterwards, so a user
+        request arriving mid-run still finds a slot; otherwise returns None.
+        Background work does not hold ACTIVE_LOCK itself.
+        """
+        with self._cond:
+            if self.running or self._queue or self.max_concurrent - 1 < reserve:
+                return None
+            if self._per_user.get(user_id, 0) >= self.user_limit(user_id) or self._active_elsewhere():
+                return None
+            user_lock = self._lock_user_slot(user_id)
+            if user_lock is False:
+                return None
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+            self.running += 1
+        return (user_id, time.monotonic(), (user_lock,))
+
+    def release(self, token):
+        user_id, started, locks = token
+        with self._cond:
+            self.running -= 1
+            self._release_user(user_id, locks)
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.monotonic() - started)
+            self._cond.notify_all()
+
+    def _release_user(self, user_id, locks=()):
+        for handle in locks:
+            if handle:
+                # Closing the file drops its flock.
+                handle.close()
+        count = self._per_user.get(user_id, 0) - 1
+        if count > 0:
+            self._per_user[user_id] = count
+        else:
+            self._per_user.pop(user_id, None)
+
+    @contextmanager
+    def slot(self, user_id):
+        """Context manager form of acquire/release."""
+        token = self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def stream(self, token, chunks):
+        """
+        Wraps a streaming response body so its slot is released when the body
+        is exhausted or closed (e.g. the client disconnects).
+        """
+        return _GovernedStream(self, token, chunks)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": self.running,
+                "queued": len(self._queue),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "torch_threads": TORCH_THREADS,
+            }
+
+
+class _GovernedStream:
+    def __init__(self, governor, token, chunks):
+        self._governor = governor
+        self._token = token
+        self._chunks = iter(chunks)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._token is None:
+            return
+        token, self._token = self._token, None
+        try:
+            if hasattr(self._chunks, "close"):
+                self._chunks.close()
+        finally:
+            self._governor.release(token)
+
+
+analysis_governor = AnalysisGovernor()
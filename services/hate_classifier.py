@@ -6,8 +6,8 @@ that emotion to either 'Hope' or 'Hate'.
 """
 import os
 import pickle
-import torch
-from transformers import AutoTokenizer
+import threading
+from services import cascade
 
 
 
@@ -24,17 +24,34 @@ HOPE_LABELS = {"joy", "love", "surprise"}
 
 model = None
 tokenizer = None
+model_warm = False
+_load_lock = threading.Lock()
+_warmup_thread = None
 
 def load_model():
     """
     Lazy loads the model and tokenizer if they haven't been loaded yet.
+    torch and transformers are only imported here, on first real use.
     """
+    with _load_lock:
+        _load_model()
+
+def _load_model():
     global model, tokenizer
     if model is not None and tokenizer is not None:
         return
 
     print("⏳ Loading model and tokenizer...")
     try:
+        import torch
+        from transformers import AutoTokenizer
+        from services.governor import TORCH_THREADS
+
+        # Each concurrent analysis gets a fixed share of the cores (see
+        # services.governor) instead of torch's default of all of them.
+        torch.set_num_threads(TORCH_THREADS)
+
+
         if not os.path.isfile(MODEL_PATH):
             raise OSError(f"Model file not found at '{MODEL_PATH}'")
             
@@ -60,13 +77,43 @@ def load_model():
 def predict_hope_hate(text):
     """
     Analyzes text to classify its emotion and determine if it's Hope or Hate speech.
+
+    Besides the top emotion, the result carries "probs": the whole emotion
+    distribution as a float16 vector in EMOTION_LABELS order (None if the
+    prediction failed), so other hope/hate mappings can be derived later.
+
+    The distilled linear model in `services.cascade` is tried first; the
+    transformer only runs when its confidence is below CASCADE_THRESHOLD.
+    """
+    cheap = cascade.predict_cheap(text)
+    if cheap is not None and cheap[1] >= cascade.CASCADE_THRESHOLD:
+        predicted_emotion, score, probs = cheap
+        return {
+            "text": text,
+            "hope_hate": "Hope" if predicted_emotion in HOPE_LABELS else "Hate",
+            "emotion": predicted_emotion,
+            "score": round(float(score), 3),
+            "probs": probs,
+            "source": "linear"
+        }
+
+    return predict_transformer(text)
+
+def predict_transformer(text):
+    """
+    Classifies text with the full DistilBERT model, bypassing the cascade.
     """
+    global model_warm
     # Ensure model is loaded before prediction
     load_model()
+    import torch
 
     if not model or not tokenizer:
         print("❌ Model or tokenizer is not loaded. Cannot perform prediction.")
-        return {"text": text, "hope_hate": "Unknown", "emotion": "unknown", "score": 0.0}
+        return {"text": text, "hope_hate": "Unknown", "emotion": "unknown", "score": 0.0, "probs": None,
+                "source": "transformer"}
+
+    probs = None
 
     try:
       
@@ -83,12 +130,14 @@ def predict_hope_hate(text):
    
         prediction_index = torch.argmax(probabilities).item()
         score = probabilities[prediction_index].item()
+        probs = probabilities.to(torch.float16).numpy()
         
        
         predicted_emotion = EMOTION_LABELS[prediction_index]
 
 
         hope_hate = "Hope" if predicted_emotion in HOPE_LABELS else "Hate"
+        model_warm = True
 
     except IndexError:
         print(f"❌ Error: Prediction index {prediction_index} is out of bounds for EMOTION_LABELS.")
@@ -101,5 +150,34 @@ def predict_hope_hate(text):
         "text": text,
         "hope_hate": hope_hate,
         "emotion": predicted_emotion,
-        "score": round(float(score), 3)
+        "score": round(float(score), 3),
+        "probs": probs,
+        "source": "transformer"
     }
+
+def is_model_ready():
+    """True once the model is loaded and has served at least one inference."""
+    return model is not None and tokenizer is not None and model_warm
+
+def warm_up():
+    """
+    Loads the model (and the cascade, if trained) and runs one dummy
+    inference so the first real request does not pay for lazy initialisation.
+    """
+    cascade.load_cascade_model()
+    predict_transformer("Thank you for this video, it made my day!")
+    print("✅ Model warmed up." if model_warm else "❌ Model warm-up failed.")
+    return model_warm
+
+def start_warm_up():
+    """
+    Runs `warm_up` in a background thread unless the model is already warm or
+    a warm-up is in progress. Returns True when a new warm-up was started.
+    """
+    global _warmup_thread
+    with _load_lock:
+        if model_warm or (_warmup_thread is not None and _warmup_thread.is_alive()):
+            return False
+        _warmup_thread = threading.Thread(target=warm_up, name='model-warmup', daemon=True)
+        _warmup_thread.start()
+    return True
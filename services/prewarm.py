@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Scheduled pre-warming of analyses for the most-requested videos.
+
+On every cycle the refresher reads the predictions table for the videos
+requested most often in the last PREWARM_WINDOW_DAYS days. It re-analyses
+those whose stored result is older than PREWARM_REFRESH_AFTER seconds and
+stores the results in warm_analyses. /predict serves a stored result younger
+than PREWARM_SERVE_MAX_AGE straight away, together with its age.
+
+API calls are charged to a `QuotaBudget` that holds what is left of
+PREWARM_DAILY_QUOTA for the current UTC day. Spending is recorded per run in
+prewarm_runs, so the daily limit holds across restarts. Every /predict
+lookup is counted as a hit or a miss in warm_lookups to give the hit rate.
+
+The refresher only starts a video while no user analysis is running or
+queued in any worker process on the host (see ACTIVE_LOCK in
+services.governor), and otherwise defers the rest of the list to the next
+cycle. Inside the web process it also leaves one analysis slot free, so a
+request arriving mid-crawl starts straight away instead of queueing behind
+it; with ANALYSIS_MAX_CONCURRENT=1 there is no slot to spare and it only runs
+standalone. A standalone refresher holds no web slot but still shares the
+CPU with the web workers while it crawls. Stored analyses older than PREWARM_RETENTION seconds are
+deleted, and run/lookup history older than PREWARM_HISTORY_DAYS days.
+
+Run the refresher in the web process with PREWARM_ENABLED=1. Only one
+gunicorn worker runs it, chosen by a lock file. It can also run as its own
+process:
+
+    python -m services.prewarm run
+    python -m services.prewarm run --once
+    python -m services.prewarm status
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+from database import (
+    get_popular_videos, save_warm_analysis, get_warm_analysis, get_warm_analysis_ages,
+    start_prewarm_run, update_prewarm_run, get_prewarm_quota_used_today,
+    get_recent_prewarm_runs, record_warm_lookup, get_warm_lookup_stats,
+    prune_warm_analyses, prune_prewarm_history
+)
+from services.governor import analysis_governor
+from services.quota import QuotaBudget
+
+PREWARM_ENABLED = os.environ.get("PREWARM_ENABLED", "0") == "1"
+PREWARM_INTERVAL = float(os.environ.get("PREWARM_INTERVAL", "600"))
+PREWARM_TOP_N = int(os.environ.get("PREWARM_TOP_N", "20"))
+PREWARM_WINDOW_DAYS = int(os.environ.get("PREWARM_WINDOW_DAYS", "7"))
+PREWARM_DAILY_QUOTA = int(os.environ.get("PREWARM_DAILY_QUOTA", "2000"))
+PREWARM_REFRESH_AFTER = float(os.environ.get("PREWARM_REFRESH_AFTER", "1800"))
+PREWARM_SERVE_MAX_AGE = float(os.environ.get("PREWARM_SERVE_MAX_AGE", "3600"))
+PREWARM_LOCK_FILE = os.environ.get("PREWARM_LOCK_FILE", os.path.join("instance", "prewarm.lock"))
+PREWARM_RETENTION = float(os.environ.get("PREWARM_RETENTION", "86400"))
+PREWARM_HISTORY_DAYS = int(os.environ.get("PREWARM_HISTORY_DAYS", "30"))
+
+# Governor user ID for refresher analyses, so at most one runs at a time.
+PREWARM_USER = "prewarm"
+
+_lock_file = None
+
+
+def get_warm_result(video_id, max_age=PREWARM_SERVE_MAX_AGE, record=True):
+    """
+    Returns the stored analysis of `video_id` if it is at most `max_age`
+    seconds old, as a dict with "result", "age_seconds", "refreshed_at" and
+    "source". Otherwise returns None. With `record`, the lookup counts towards
+    the hit-rate metrics.
+    """
+    warm = get_warm_analysis(video_id)
+    hit = warm is not None and warm['age_seconds'] <= max_age
+    if record:
+        try:
+            record_warm_lookup(hit, warm['age_seconds'] if hit else 0)
+        except Exception as e:
+            print(f"❌ Could not record warm lookup: {e}")
+    return warm if hit else None
+
+
+def store_result(video_id, result, source="request", quota_used=0):
+    """Stores a complete analysis so later requests for the video are served warm."""
+    from services.batch import compact_result
+
+    if result.get("error"):
+        return False
+    save_warm_analysis(video_id, compact_result(result), source, quota_used)
+    prune_warm_analyses(PREWARM_RETENTION)
+    return True
+
+
+def refresh_cycle(top_n=PREWARM_TOP_N, daily_quota=PREWARM_DAILY_QUOTA, reserve=1):
+    """
+    Runs one refresh pass over the most-requested videos, leaving `reserve`
+    analysis slots of this process free. Returns a dict with the videos
+    refreshed and the quota spent.
+    """
+    from services.youtube import analyze_youtube_comments
+
+    prune_warm_analyses(PREWARM_RETENTION)
+    prune_prewarm_history(PREWARM_HISTORY_DAYS)
+    used_today = get_prewarm_quota_used_today()
+    quota = QuotaBudget(max(0, daily_quota - used_today))
+    run_id = start_prewarm_run()
+    refreshed, skipped, error = [], 0, None
+
+    for video_id, requests in get_popular_videos(top_n, PREWARM_WINDOW_DAYS):
+        warm = get_warm_analysis(video_id)
+        if warm is not None and warm['age_seconds'] < PREWARM_REFRESH_AFTER:
+            skipped += 1
+            continue
+        if not quota.remaining:
+            error = "Daily pre-warm quota budget exhausted."
+            break
+
+        # Only start while no user analysis is in flight on the host, and
+        # leave the rest of the list for the next cycle otherwise.
+        token = analysis_governor.try_acquire_spare(PREWARM_USER, reserve)
+        if token is None:
+            if analysis_governor.max_concurrent - 1 < reserve:
+                error = "No analysis slot to spare; run the refresher standalone."
+            else:
+                error = "Deferred: user analyses in progress."
+            break
+        spent_before = quota.used
+        try:
+            result = analyze_youtube_comments(video_id, quota=quota)
+        except ConnectionError as e:
+            error = str(e)
+            break
+        finally:
+            analysis_governor.release(token)
+            update_prewarm_run(run_id, len(refreshed), quota.used, error)
+
+        if result.get("quota_exhausted"):
+            # A partial crawl is not stored; the video is redone tomorrow.
+            error = result["error"]
+            break
+        if store_result(video_id, result, source="prewarm", quota_used=quota.used - spent_before):
+            refreshed.append(video_id)
+            print(f"✅ Pre-warmed {video_id} ({requests} recent requests, {quota.used - spent_before} quota units).")
+        else:
+            print(f"❌ Pre-warm of {video_id} failed: {result.get('error')}")
+
+    update_prewarm_run(run_id, len(refreshed), quota.used, error, finished=True)
+    return {"run_id": run_id, "refreshed": refreshed, "skipped_fresh": skipped,
+            "quota_used": quota.used, "quota_used_today": used_today + quota.used, "error": error}
+
+
+def run_forever(interval=PREWARM_INTERVAL, stop_event=None, reserve=1):
+    """Runs refresh cycles every `interval` seconds until `stop_event` is set."""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        started = time.monotonic()
+        try:
+            summary = refresh_cycle(reserve=reserve)
+            print(f"--- Pre-warm cycle: {len(summary['refreshed'])} refreshed, "
+                  f"{summary['quota_used_today']}/{PREWARM_DAILY_QUOTA} quota units today ---")
+        except Exception as e:
+            print(f"❌ Pre-warm cycle failed: {e}")
+        stop_event.wait(max(0.0, interval - (time.monotonic() - started)))
+
+
+def _take_leader_lock():
+    """True in exactly one process per host: the one holding PREWARM_LOCK_FILE."""
+    global _lock_file
+    try:
+        import fcntl
+    except ImportError:
+        return True
+    directory = os.path.dirname(PREWARM_LOCK_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handle = open(PREWARM_LOCK_FILE, "w")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    # Kept open for the life of the process; the lock is released on exit.
+    _lock_file = handle
+    return True
+
+
+def _run_background():
+    # The web app creates its tables on the first request; the refresher may start earlier.
+    from database import init_db
+    os.makedirs('instance', exist_ok=True)
+    init_db()
+    run_forever()
+
+
+def start_background():
+    """Starts the refresher thread unless another process on this host runs it."""
+    if analysis_governor.max_concurrent < 2:
+        print("ℹ️ Pre-warm refresher needs ANALYSIS_MAX_CONCURRENT >= 2 to leave a slot for users; "
+              "run `python -m services.prewarm run` as its own process instead.")
+        return None
+    if not _take_leader_lock():
+        print("ℹ️ Pre-warm refresher already running in another process.")
+        return None
+    thread = threading.Thread(target=_run_background, name="prewarm", daemon=True)
+    thread.start()
+    print(f"✅ Pre-warm refresher started (every {PREWARM_INTERVAL:.0f}s, top {PREWARM_TOP_N} videos).")
+    return thread
+
+
+def metrics(days=7):
+    """Hit rate, served-data age, warm-set age and quota use, for tuning the schedule."""
+    lookups = get_warm_lookup_stats(days)
+    hits = sum(day['hits'] for day in lookups)
+    misses = sum(day['misses'] for day in lookups)
+    hit_age_sum = sum(day['hit_age_sum'] for day in lookups)
+    ages = [row['age_seconds'] for row in get_warm_analysis_ages()]
+
+    return {
+        "lookups": {
+            "days": days,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "mean_served_age_seconds": round(hit_age_sum / hits, 1) if hits else None,
+            "daily": lookups,
+        },
+        "warm_set": {
+            "videos": len(ages),
+            "servable": sum(1 for age in ages if age <= PREWARM_SERVE_MAX_AGE),
+            "age_seconds": {
+                "min": min(ages),
+                "median": statistics.median(ages),
+                "max": max(ages),
+            } if ages else None,
+        },
+        "quota": {"daily_budget": PREWARM_DAILY_QUOTA, "used_today": get_prewarm_quota_used_today()},
+        "schedule": {
+            "enabled": PREWARM_ENABLED,
+            "interval_seconds": PREWARM_INTERVAL,
+            "top_n": PREWARM_TOP_N,
+            "window_days": PREWARM_WINDOW_DAYS,
+            "refresh_after_seconds": PREWARM_REFRESH_AFTER,
+            "serve_max_age_seconds": PREWARM_SERVE_MAX_AGE,
+            "retention_seconds": PREWARM_RETENTION,
+        },
+        "recent_runs": get_recent_prewarm_runs(),
+    }
+
+
+def main(argv=None):
+    from database import init_db
+
+    parser = argparse.ArgumentParser(description="Pre-warm analyses of the most-requested videos.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Refresh on a schedule (or once).")
+    run.add_argument("--once", action="store_true", help="Run a single cycle and exit.")
+    run.add_argument("--interval", type=float, default=PREWARM_INTERVAL)
+    sub.add_parser("status", help="Print pre-warm metrics as JSON.")
+    args = parser.parse_args(argv)
+
+    os.makedirs('instance', exist_ok=True)
+    init_db()
+    if args.command == "status":
+        print(json.dumps(metrics(), indent=2))
+    elif args.once:
+        # Standalone, no user request shares this process's slots.
+        print(json.dumps(refresh_cycle(reserve=0), indent=2))
+    else:
+        try:
+            run_forever(args.interval, reserve=0)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
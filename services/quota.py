@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Shared YouTube Data API quota accounting.
+
+Every list call the app makes costs one quota unit. A `QuotaBudget` is shared
+by all threads working on the same job, so a batch or refresh run stops cleanly
+once it has spent what it was given instead of exhausting the project's daily
+quota.
+"""
+import threading
+
+# Units charged per API call (YouTube Data API v3 list methods).
+LIST_CALL_COST = 1
+
+
+class QuotaExceeded(Exception):
+    """Raised when a call would exceed the budget."""
+
+
+class QuotaBudget:
+    """
+    Budget of `limit` units. With a `parent` (anything with a `spend` method,
+    e.g. a budget shared by all jobs), every spend is charged to it as well.
+    """
+
+    def __init__(self, limit, used=0, parent=None):
+        self.limit = limit
+        self.used = used
+        self.parent = parent
+        self._lock = threading.Lock()
+
+    def spend(self, units=LIST_CALL_COST):
+        """Reserves `units` before a call; raises QuotaExceeded when out of budget."""
+        with self._lock:
+            if self.used + units > self.limit:
+                raise QuotaExceeded(f"API quota budget of {self.limit} units exhausted.")
+            if self.parent is not None:
+                self.parent.spend(units)
+            self.used += units
+
+    @property
+    def remaining(self):
+        with self._lock:
+            return max(0, self.limit - self.used)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Offline hope/hate scoring of comment dumps, without the Flask app or the
+YouTube API.
+
+The input (CSV with a text column, or NDJSON with a text field) is read in
+streaming chunks, and the chunks are spread over a process pool in which each
+worker loads the model once. Results are written in input order, with a
+checkpoint after every chunk so an interrupted run picks up where it stopped:
+
+    python -m services.score_file comments.csv -o scored.csv --workers 8
+    python -m services.score_file comments.csv -o scored.csv --resume
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+
+PREDICTION_FIELDS = ["emotion", "hope_hate", "score"]
+DEFAULT_CHUNK_SIZE = 256
+
+
+def _detect_format(path, explicit=None):
+    if explicit:
+        return explicit
+    return "ndjson" if path.lower().endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+
+def _iter_rows(path, fmt):
+    """Yields input rows as dicts, one at a time."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _iter_chunks(rows, chunk_size):
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# --- worker process ---------------------------------------------------------
+
+_text_field = "text"
+
+
+def _init_worker(text_field, torch_threads):
+    """Runs once per worker: loads the model so every chunk reuses it."""
+    global _text_field
+    _text_field = text_field
+    os.environ["ANALYSIS_TORCH_THREADS"] = str(torch_threads)
+
+    from services import cascade, hate_classifier
+    hate_classifier.load_model()
+    cascade.load_cascade_model()
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+
+def _score_chunk(chunk):
+    from services.hate_classifier import predict_hope_hate
+
+    scored = []
+    for row in chunk:
+        text = row.get(_text_field) or ""
+        if text.strip():
+            out = predict_hope_hate(text)
+        else:
+            out = {"emotion": "", "hope_hate": "", "score": ""}
+        scored.append(dict(row, **{field: out[field] for field in PREDICTION_FIELDS}))
+    return scored
+
+
+# --- output / checkpointing ---------------------------------------------------
+
+def _checkpoint_path(output):
+    return output + ".ckpt"
+
+
+def _load_checkpoint(output, input_path):
+    try:
+        with open(_checkpoint_path(output), encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get("input") != os.path.abspath(input_path):
+        raise ValueError(f"Checkpoint for '{output}' belongs to a different input file.")
+    return checkpoint
+
+
+def _save_checkpoint(output, checkpoint):
+    tmp = _checkpoint_path(output) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, _checkpoint_path(output))
+
+
+class _Writer:
+    """Appends scored rows in CSV or NDJSON and reports the byte offset written."""
+
+    def __init__(self, path, fmt, resume_offset=None):
+        self.fmt = fmt
+        if resume_offset is not None:
+            self._file = open(path, "r+b")
+            # Drop anything written after the last checkpoint.
+            self._file.truncate(resume_offset)
+            self._file.seek(resume_offset)
+        else:
+            self._file = open(path, "wb")
+        self._fieldnames = None
+        self._header_written = resume_offset is not None and resume_offset > 0
+
+    def write(self, rows):
+        if self.fmt == "ndjson":
+            data = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+        else:
+            if self._fieldnames is None:
+                self._fieldnames = list(rows[0].keys())
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=self._fieldnames, extrasaction="ignore")
+            if not self._header_written:
+                writer.writeheader()
+                self._header_written = True
+            writer.writerows(rows)
+            data = buffer.getvalue()
+        self._file.write(data.encode("utf-8"))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+# --- driver -------------------------------------------------------------------
+
+def score_file(input_path, output_path, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+               text_field="text", input_format=None, output_format=None, resume=False):
+    """
+    Scores every row of `input_path` into `output_path`. Returns the number of
+    rows written. With `resume`, continues from the last checkpoint.
+    """
+    workers = workers or os.cpu_count() or 1
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    input_format = _detect_format(input_path, input_format)
+    output_format = _detect_format(output_path, output_format)
+
+    checkpoint = _load_checkpoint(output_path, input_path) if resume else None
+    if checkpoint is None:
+        checkpoint = {"input": os.path.abspath(input_path), "chunk_size": chunk_size,
+                      "chunks_done": 0, "rows_done": 0, "output_bytes": 0}
+        writer = _Writer(output_path, output_format)
+    else:
+        chunk_size = checkpoint["chunk_size"]
+        writer = _Writer(output_path, output_format, resume_offset=checkpoint["output_bytes"])
+        print(f"Resuming after {checkpoint['rows_done']} rows ({checkpoint['chunks_done']} chunks).", file=sys.stderr)
+
+    rows = _iter_rows(input_path, input_format)
+    # Skip the rows already scored; they are parsed but not classified again.
+    for _ in islice(rows, checkpoint["rows_done"]):
+        pass
+    chunks = _iter_chunks(rows, chunk_size)
+
+    started = time.monotonic()
+    scored_this_run = 0
+    # Bounded number of chunks in flight keeps memory flat on huge inputs.
+    max_in_flight = workers * 2
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(text_field, torch_threads))
+    try:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(pool.apply_async(_score_chunk, (chunk,)))
+            while len(in_flight) >= max_in_flight:
+                scored_this_run += _write_next(in_flight, writer, output_path, checkpoint, started, scored_this_run)
+        while in_flight:
+            scored_this_run += _write_next(in_flight, writer, output_path, checkpoint, started, scored_this_run)
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+        writer.close()
+
+    print(f"Done: {checkpoint['rows_done']} rows written to '{output_path}'.", file=sys.stderr)
+    try:
+        os.remove(_checkpoint_path(output_path))
+    except OSError:
+        pass
+    return checkpoint["rows_done"]
+
+
+def _write_next(in_flight, writer, output_path, checkpoint, started, scored_this_run):
+    """Waits for the oldest chunk, writes it, checkpoints and reports progress."""
+    scored = in_flight.popleft().get()
+    checkpoint["output_bytes"] = writer.write(scored)
+    checkpoint["chunks_done"] += 1
+    checkpoint["rows_done"] += len(scored)
+    _save_checkpoint(output_path, checkpoint)
+
+    done = scored_this_run + len(scored)
+    elapsed = max(time.monotonic() - started, 1e-6)
+    print(f"...{checkpoint['rows_done']} rows scored ({done / elapsed:.1f} rows/s)", file=sys.stderr)
+    return len(scored)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV/NDJSON comment dump with the hope/hate classifier.")
+    parser.add_argument("input", help="CSV or NDJSON file of comments.")
+    parser.add_argument("--output", "-o", required=True, help="Where to write the scored rows (.csv or .ndjson).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per work unit.")
+    parser.add_argument("--text-field", default="text", help="Column/field holding the comment text.")
+    parser.add_argument("--input-format", choices=["csv", "ndjson"])
+    parser.add_argument("--output-format", choices=["csv", "ndjson"])
+    parser.add_argument("--resume", action="store_true", help="Continue from the output's checkpoint.")
+    args = parser.parse_args(argv)
+
+    score_file(args.input, args.output, workers=args.workers, chunk_size=args.chunk_size,
+               text_field=args.text_field, input_format=args.input_format,
+               output_format=args.output_format, resume=args.resume)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
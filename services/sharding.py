@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Sharded hope/hate classification of a video's comments.
+
+`analyze_sharded` fetches the comment pages and puts each one on the work
+queue (`services.work_queue`) as a work unit. Worker processes on this host
+(or on any host, with a networked queue backend) claim units and classify them.
+Each unit's result is a partial `CommentAggregator` state. When every unit is
+finished, the partial states are merged, once per unit, into the same result
+shape that `analyze_youtube_comments` returns.
+
+Unless SHARD_LOCAL_WORKER=0, the process that enqueued a run also works
+through that run's units. A run therefore finishes even when no separate
+workers are running. Start workers with:
+
+    python -m services.sharding worker --processes 4
+    python -m services.sharding status
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+from database import add_comment_predictions
+from services.aggregation import CommentAggregator
+from services.dedup import CommentDeduplicator
+from services.quota import QuotaExceeded
+from services.work_queue import get_work_queue
+
+SHARD_LOCAL_WORKER = os.environ.get("SHARD_LOCAL_WORKER", "1") == "1"
+SHARD_WAIT_TIMEOUT = float(os.environ.get("SHARD_WAIT_TIMEOUT", "600"))
+SHARD_POLL_SECONDS = float(os.environ.get("SHARD_POLL_SECONDS", "0.5"))
+
+
+def _worker_id(role="worker"):
+    # Includes the thread, since several request threads may each drive a run.
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}:{role}"
+
+
+def process_unit(payload):
+    """Classifies one page of comments and returns its partial aggregate."""
+    from services.youtube import classify_comment
+
+    deduplicator = CommentDeduplicator() if payload.get("dedup", True) else None
+    aggregator = CommentAggregator()
+    rows = []
+    for comment in payload["comments"]:
+        out = classify_comment(comment, deduplicator)
+        if out is None:
+            continue
+        aggregator.add(out, exemplar="duplicate_of" not in out)
+        rows.append(out)
+
+    # Upserts by comment ID, so a retried unit rewrites rather than duplicates rows.
+    if payload.get("persist") and rows:
+        add_comment_predictions(payload["video_id"], rows)
+
+    state = aggregator.to_dict()
+    state["duplicates_collapsed"] = deduplicator.collapsed if deduplicator else 0
+    return state
+
+
+def work_one(queue, worker_id, run_id=None):
+    """Claims and processes a single unit. Returns False when none was available."""
+    unit = queue.claim(worker_id, run_id=run_id)
+    if unit is None:
+        return False
+    try:
+        result = process_unit(unit.payload)
+    except Exception as e:
+        print(f"❌ Work unit {unit.id} failed (attempt {unit.attempts}): {e}")
+        queue.fail(unit, worker_id, e)
+        return True
+    if not queue.complete(unit, worker_id, result):
+        print(f"ℹ️ Work unit {unit.id} was reassigned before it finished; result dropped.")
+    return True
+
+
+def analyze_sharded(video_id, dedup=True, persist=True, quota=None, queue=None,
+                    local_worker=SHARD_LOCAL_WORKER, timeout=SHARD_WAIT_TIMEOUT):
+    """
+    Sharded counterpart of `analyze_youtube_comments`; returns the same summary
+    plus a "units" entry with the number of pages and how many could not be
+    classified.
+    """
+    from googleapiclient.errors import HttpError
+    from services.youtube import get_youtube_client, iter_comment_pages
+
+    youtube = get_youtube_client()
+    if not youtube:
+        raise ConnectionError("YouTube API service is not available.")
+
+    queue = queue or get_work_queue()
+    run_id = f"{video_id}:{uuid.uuid4().hex}"
+    worker_id = _worker_id("producer")
+    errors = {}
+    units = 0
+
+    print(f"\n--- Starting Sharded Comment Analysis for Video ID: {video_id} ---")
+    try:
+        for page in iter_comment_pages(youtube, video_id, quota):
+            queue.put(run_id, units, {"video_id": video_id, "comments": page,
+                                      "dedup": dedup, "persist": persist})
+            units += 1
+    except QuotaExceeded as e:
+        errors = {"error": str(e), "quota_exhausted": True}
+    except HttpError as e:
+        errors = {"error": f"An API error occurred: {e}. This could be due to an invalid API key, disabled API, or an invalid Video ID."}
+    except Exception as e:
+        errors = {"error": f"An unexpected error occurred: {e}"}
+    if errors:
+        print(f"\n❌ {errors['error']}")
+    print(f"...queued {units} comment pages")
+
+    # Pages fetched before an error are still classified, as in the local path.
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            progress = queue.progress(run_id)
+            if not progress.get("pending") and not progress.get("leased"):
+                break
+            if local_worker and work_one(queue, worker_id, run_id):
+                continue
+            if time.monotonic() > deadline:
+                errors.setdefault("error", f"Timed out waiting for {units} comment pages to be classified.")
+                break
+            time.sleep(SHARD_POLL_SECONDS)
+
+        aggregator = CommentAggregator()
+        duplicates_collapsed = 0
+        for state in queue.results(run_id):
+            aggregator.merge(state)
+            duplicates_collapsed += state["duplicates_collapsed"]
+        failed = queue.errors(run_id)
+        done = queue.progress(run_id).get("done", 0)
+    finally:
+        queue.purge(run_id)
+
+    if failed and "error" not in errors:
+        errors["error"] = f"{len(failed)} of {units} comment pages could not be classified: {failed[-1]}"
+
+    summary = aggregator.summary()
+    summary["duplicates_collapsed"] = duplicates_collapsed
+    summary["units"] = {"total": units, "done": done, "failed": len(failed)}
+    summary.update(errors)
+
+    print("\n--- Sharded Analysis Complete ---")
+    print(f"Total Comments Processed: {aggregator.comments_processed} ({done}/{units} pages)")
+    print(f"Hope Count: {aggregator.hope_count}")
+    print(f"Hate Count: {aggregator.hate_count}")
+    return summary
+
+
+# --- worker processes -----------------------------------------------------------
+
+def run_worker(poll_seconds=SHARD_POLL_SECONDS, exit_when_idle=False):
+    """Pulls and processes units from the shared queue until interrupted."""
+    from services import cascade, hate_classifier
+    hate_classifier.load_model()
+    cascade.load_cascade_model()
+
+    queue = get_work_queue()
+    worker_id = _worker_id()
+    processed = 0
+    print(f"✅ Worker {worker_id} ready.")
+    try:
+        while True:
+            if work_one(queue, worker_id):
+                processed += 1
+            elif exit_when_idle:
+                break
+            else:
+                time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        pass
+    print(f"Worker {worker_id} stopped after {processed} units.")
+    return processed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded comment classification workers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    worker = sub.add_parser("worker", help="Run classifier workers against the shared queue.")
+    worker.add_argument("--processes", type=int, default=1, help="Worker processes to start on this host.")
+    worker.add_argument("--poll", type=float, default=SHARD_POLL_SECONDS, help="Seconds to wait when the queue is empty.")
+    worker.add_argument("--exit-when-idle", action="store_true", help="Stop once the queue is empty.")
+
+    sub.add_parser("status", help="Print unit counts per status as JSON.")
+
+    args = parser.parse_args(argv)
+    if args.command == "status":
+        print(json.dumps(get_work_queue().summary(), indent=2))
+        return 0
+
+    # Split the cores between the worker processes, as the web workers do.
+    os.environ.setdefault("ANALYSIS_TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // args.processes)))
+    if args.processes == 1:
+        run_worker(args.poll, args.exit_when_idle)
+        return 0
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(args.poll, args.exit_when_idle), name=f"shard-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Durable work queue for sharded comment classification.
+
+Work units are grouped into runs (one run per analysed video). A worker
+claims a unit with a time-limited lease and then either completes it with a
+result or fails it. A failed unit, or one whose lease ran out because its
+worker died, goes back to pending until it has used up its attempts.
+
+Completion is only accepted from the worker that currently holds the lease.
+A worker that lost its lease to a retry cannot also report a result, so every
+unit is counted exactly once.
+
+The default backend is a SQLite file (WORK_QUEUE_DB) in WAL mode, shared by
+worker processes on one host. WAL needs shared memory and does not work on
+network filesystems, so the file must not be shared between hosts. For
+workers on several hosts, implement `WorkQueue` over a networked store and
+set WORK_QUEUE_BACKEND to "package.module:ClassName".
+"""
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+WORK_QUEUE_BACKEND = os.environ.get("WORK_QUEUE_BACKEND", "sqlite")
+WORK_QUEUE_DB = os.environ.get("WORK_QUEUE_DB", "instance/work_queue.db")
+WORK_LEASE_SECONDS = float(os.environ.get("WORK_LEASE_SECONDS", "300"))
+WORK_MAX_ATTEMPTS = int(os.environ.get("WORK_MAX_ATTEMPTS", "3"))
+
+WorkUnit = namedtuple("WorkUnit", ["id", "run_id", "seq", "payload", "attempts"])
+
+
+class WorkQueue:
+    """Interface every queue backend implements."""
+
+    def put(self, run_id, seq, payload, max_attempts=WORK_MAX_ATTEMPTS):
+        """Enqueues unit `seq` of `run_id`. Enqueueing the same unit twice is a no-op."""
+        raise NotImplementedError
+
+    def claim(self, worker_id, run_id=None, lease_seconds=WORK_LEASE_SECONDS):
+        """Leases the oldest available unit (optionally only from `run_id`), or returns None."""
+        raise NotImplementedError
+
+    def complete(self, unit, worker_id, result):
+        """Stores a unit's result. Returns False if `worker_id` no longer holds the lease."""
+        raise NotImplementedError
+
+    def fail(self, unit, worker_id, error):
+        """Releases a unit for a retry, or marks it failed once its attempts are used up."""
+        raise NotImplementedError
+
+    def progress(self, run_id):
+        """Returns {status: count} for a run's units."""
+        raise NotImplementedError
+
+    def results(self, run_id):
+        """Yields the result of every completed unit of a run, in unit order."""
+        raise NotImplementedError
+
+    def errors(self, run_id):
+        """Returns the last error of every failed unit of a run."""
+        raise NotImplementedError
+
+    def purge(self, run_id):
+        """Removes every unit of a run."""
+        raise NotImplementedError
+
+    def summary(self):
+        """Returns {status: count} over every unit in the queue."""
+        raise NotImplementedError
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """`WorkQueue` backed by a SQLite file shared by the workers on one host."""
+
+    def __init__(self, path=WORK_QUEUE_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS work_units (
+                id TEXT PRIMARY KEY,
+                run_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_work_units_status ON work_units (status, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_work_units_run ON work_units (run_id, status)')
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        # Autocommit mode so claim() can take the write lock up front with BEGIN IMMEDIATE.
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def put(self, run_id, seq, payload, max_attempts=WORK_MAX_ATTEMPTS):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR IGNORE INTO work_units (id, run_id, seq, payload, max_attempts, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (f"{run_id}:{seq}", run_id, seq, json.dumps(payload), max_attempts, time.time())
+        )
+        conn.close()
+
+    def claim(self, worker_id, run_id=None, lease_seconds=WORK_LEASE_SECONDS):
+        now = time.time()
+        run_filter = 'AND run_id = ?' if run_id else ''
+        params = (now, run_id) if run_id else (now,)
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # Units whose worker died on their last attempt are not retried again.
+            conn.execute(
+                "UPDATE work_units SET status = 'failed', lease_owner = NULL, "
+                "error = COALESCE(error, 'lease expired') "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+                (now,)
+            )
+            row = conn.execute(
+                "SELECT id, run_id, seq, payload, attempts FROM work_units "
+                "WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                f"{run_filter} ORDER BY created_at, seq LIMIT 1",
+                params
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                "UPDATE work_units SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now + lease_seconds, row['id'])
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return WorkUnit(row['id'], row['run_id'], row['seq'], json.loads(row['payload']), row['attempts'] + 1)
+
+    def complete(self, unit, worker_id, result):
+        conn = self._connect()
+        cursor = conn.execute(
+            "UPDATE work_units SET status = 'done', result = ?, lease_owner = NULL, error = NULL "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (json.dumps(result), unit.id, worker_id)
+        )
+        conn.close()
+        return cursor.rowcount == 1
+
+    def fail(self, unit, worker_id, error):
+        conn = self._connect()
+        cursor = conn.execute(
+            "UPDATE work_units SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+            "lease_owner = NULL, error = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (str(error), unit.id, worker_id)
+        )
+        conn.close()
+        return cursor.rowcount == 1
+
+    def progress(self, run_id):
+        conn = self._connect()
+        rows = conn.execute(
+            'SELECT status, COUNT(*) AS count FROM work_units WHERE run_id = ? GROUP BY status',
+            (run_id,)
+        ).fetchall()
+        conn.close()
+        return {row['status']: row['count'] for row in rows}
+
+    def results(self, run_id):
+        conn = self._connect()
+        try:
+            for row in conn.execute(
+                "SELECT result FROM work_units WHERE run_id = ? AND status = 'done' ORDER BY seq",
+                (run_id,)
+            ):
+                yield json.loads(row['result'])
+        finally:
+            conn.close()
+
+    def errors(self, run_id):
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT error FROM work_units WHERE run_id = ? AND status = 'failed' ORDER BY seq",
+            (run_id,)
+        ).fetchall()
+        conn.close()
+        return [row['error'] for row in rows]
+
+    def purge(self, run_id):
+        conn = self._connect()
+        conn.execute('DELETE FROM work_units WHERE run_id = ?', (run_id,))
+        conn.close()
+
+    def summary(self):
+        conn = self._connect()
+        rows = conn.execute('SELECT status, COUNT(*) AS count FROM work_units GROUP BY status').fetchall()
+        conn.close()
+        return {row['status']: row['count'] for row in rows}
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_work_queue():
+    """Returns the process-wide queue selected by WORK_QUEUE_BACKEND."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            if WORK_QUEUE_BACKEND == "sqlite":
+                _queue = SQLiteWorkQueue()
+            else:
+                module_name, _, class_name = WORK_QUEUE_BACKEND.partition(":")
+                _queue = getattr(importlib.import_module(module_name), class_name)()
+        return _queue
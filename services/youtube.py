@@ -2,38 +2,75 @@
 """
 This script uses the YouTube Data API to fetch comments and analyze them.
 """
+import itertools
 import os
 import re
-import googleapiclient.discovery
-import googleapiclient.errors
-from langdetect import detect
+import threading
 from services.hate_classifier import predict_hope_hate
+from services.dedup import CommentDeduplicator, SKIPPED
+from services.aggregation import CommentAggregator
+from services.quota import QuotaExceeded
+from database import add_comment_predictions
 
-# --- IMPORTANT ---
-# The YouTube Data API v3 Key is loaded from environment variables
-DEVELOPER_KEY = os.environ.get("YOUTUBE_API_KEY")
-# -----------------
+# Comments written to the comment_predictions table per transaction.
+PERSIST_BATCH_SIZE = 5000
+
+# Classify comment pages on the shared work queue instead of in-process.
+SHARDED_ANALYSIS = os.environ.get("SHARDED_ANALYSIS", "0") == "1"
 
 # 1. YouTube API Setup
 api_service_name = "youtube"
 api_version = "v3"
 
-youtube = None
-if DEVELOPER_KEY:
-    try:
-        youtube = googleapiclient.discovery.build(
-            api_service_name, api_version, developerKey=DEVELOPER_KEY
-        )
-    except Exception as e:
-        print(f"❌ Error creating YouTube API service: {e}")
-        print("Please ensure your YOUTUBE_API_KEY is correct and the API is enabled.")
-else:
-    print("❌ YOUTUBE_API_KEY not found in environment variables.")
-    print("Please set it in your .env file to use YouTube features.")
+# The client (and googleapiclient itself) is only built on first use, so
+# importing this module stays cheap for pages that never touch the API.
+_youtube = None
+_youtube_lock = threading.Lock()
+
+def get_youtube_client():
+    """
+    Returns the shared YouTube Data API client, building it on first call.
+    The API key is read from the YOUTUBE_API_KEY environment variable; when
+    YOUTUBE_FAKE_DATA points at a fixture file, the local fake API from
+    `services.fake_youtube` is used instead.
+    """
+    global _youtube
+    if _youtube is not None:
+        return _youtube
+
+    with _youtube_lock:
+        if _youtube is not None:
+            return _youtube
+
+        fake_data = os.environ.get("YOUTUBE_FAKE_DATA")
+        if fake_data:
+            from services.fake_youtube import FakeYouTube
+            _youtube = FakeYouTube.from_file(fake_data)
+            print(f"ℹ️ Using fake YouTube API data from '{fake_data}'.")
+            return _youtube
+
+        developer_key = os.environ.get("YOUTUBE_API_KEY")
+        if not developer_key:
+            print("❌ YOUTUBE_API_KEY not found in environment variables.")
+            print("Please set it in your .env file to use YouTube features.")
+            return None
+        try:
+            import googleapiclient.discovery
+            _youtube = googleapiclient.discovery.build(
+                api_service_name, api_version, developerKey=developer_key
+            )
+        except Exception as e:
+            print(f"❌ Error creating YouTube API service: {e}")
+            print("Please ensure your YOUTUBE_API_KEY is correct and the API is enabled.")
+    return _youtube
 
 # 2. Helper Functions
 def is_english(text):
     """Checks if text is English."""
+    from langdetect import detect, DetectorFactory
+    # langdetect samples randomly unless seeded; a fixed seed gives every run
+    # (and every cached SKIPPED duplicate cluster) the same decision.
+    DetectorFactory.seed = 0
     try:
         return detect(text) == "en"
     except:
@@ -52,88 +89,215 @@ def extract_video_id(video_input):
     return video_input.strip()
 
 # 3. Main Analysis Function
-def analyze_youtube_comments(video_id):
+def iter_comment_pages(youtube, video_id, quota=None):
     """
-    Fetches comments for a given video ID and performs hope/hate analysis.
+    Yields the video's top-level comments one API page at a time, each page as
+    a list of {"comment_id", "text"} dicts. Every page request is charged to
+    `quota` when one is given.
+    """
+    nextPageToken = None
+    while True:
+        if quota is not None:
+            quota.spend()
+        request = youtube.commentThreads().list(
+            part="snippet",
+            videoId=video_id,
+            maxResults=100,  # Max allowed by API
+            order="time", # Change order to time
+            pageToken=nextPageToken,
+            textFormat="plainText"
+        )
+        response = request.execute()
+
+        page = []
+        for item in response["items"]:
+            top_level = item["snippet"]["topLevelComment"]
+            page.append({
+                "comment_id": top_level.get("id", item.get("id")),
+                "text": top_level["snippet"]["textDisplay"],
+            })
+        yield page
+
+        nextPageToken = response.get("nextPageToken")
+        if not nextPageToken:
+            print("--- Reached end of comments ---")
+            break
+
+def api_error_status(error):
+    """HTTP status of a YouTube API error (HttpError or the fake client's), or None."""
+    status = getattr(error, "status", None) or getattr(getattr(error, "resp", None), "status", None)
+    return int(status) if status else None
+
+def classify_comment(comment, deduplicator=None):
+    """
+    Returns the prediction row for one {"comment_id", "text"} comment, or None
+    when it is skipped (not English or no text). Near-duplicates already seen
+    by `deduplicator` reuse the cached label and carry a "duplicate_of" key.
     """
+    comment_text = comment["text"]
+    cluster_id, cached = None, None
+    if deduplicator:
+        # Looked up first so copies of a spam comment skip language detection too.
+        cluster_id, cached = deduplicator.lookup(comment_text)
+
+    if cached == SKIPPED:
+        return None
+    if cached is not None:
+        out = dict(cached, text=comment_text, duplicate_of=cluster_id)
+    elif not contains_text(comment_text) or not is_english(comment_text):
+        if deduplicator:
+            deduplicator.add(comment_text, SKIPPED)
+        return None
+    else:
+        out = predict_hope_hate(comment_text)
+        if deduplicator:
+            deduplicator.add(comment_text, out)
+    out["comment_id"] = comment["comment_id"]
+    return out
+
+def iter_comment_predictions(video_id, dedup=True, quota=None, prefetch=False):
+    """
+    Returns a generator of per-comment predictions for a video, fetched page by
+    page so callers can stream them without holding the whole video in memory.
+
+    Each row is the `predict_hope_hate` output plus the YouTube comment ID;
+    rows for collapsed duplicates carry a "duplicate_of" cluster ID. Raises
+    ConnectionError straight away when the YouTube API is unavailable.
+
+    With `prefetch`, the first page is requested before returning, so an
+    invalid video ID or API error is raised here rather than mid-stream.
+
+    When a `services.quota.QuotaBudget` is given, each page request is charged
+    to it and QuotaExceeded stops the stream once it is spent.
+    """
+    youtube = get_youtube_client()
     if not youtube:
         raise ConnectionError("YouTube API service is not available.")
 
-    hope_count = 0
-    hate_count = 0
-    comments_processed = 0
-    results = []
-    nextPageToken = None
+    deduplicator = CommentDeduplicator() if dedup else None
+    pages = iter_comment_pages(youtube, video_id, quota)
+    if prefetch:
+        first = next(pages, None)
+        pages = itertools.chain([first] if first is not None else [], pages)
+
+    def _rows():
+        for page in pages:
+            for comment in page:
+                out = classify_comment(comment, deduplicator)
+                if out is not None:
+                    yield out
+
+    return _PredictionStream(_rows(), deduplicator)
 
-    print(f"\n--- Starting Comment Analysis for Video ID: {video_id} ---")
-    try:
-        while True:
-            request = youtube.commentThreads().list(
-                part="snippet",
-                videoId=video_id,
-                maxResults=100,  # Max allowed by API
-                order="time", # Change order to time
-                pageToken=nextPageToken,
-                textFormat="plainText"
-            )
-            response = request.execute()
 
-            for item in response["items"]:
-                comment_text = item["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
-                
-                if not is_english(comment_text) or not contains_text(comment_text):
-                    continue
+class _PredictionStream:
+    """Iterator over comment predictions that also exposes the dedup stats."""
 
-                out = predict_hope_hate(comment_text)
-                comments_processed += 1
+    def __init__(self, rows, deduplicator):
+        self._rows = rows
+        self.deduplicator = deduplicator
 
-                print(f"Comment: {comment_text[:70]}...") # Print first 70 chars of comment
-                print(f"Prediction: {out}") # Print the prediction result
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._rows)
+
+    @property
+    def duplicates_collapsed(self):
+        return self.deduplicator.collapsed if self.deduplicator else 0
+
+
+def analyze_youtube_comments(video_id, dedup=True, keep_results=False, persist=True, quota=None,
+                             sharded=None):
+    """
+    Fetches comments for a given video ID and performs hope/hate analysis.
 
-                if comments_processed % 20 == 0:
-                    print(f"...processed {comments_processed} comments")
+    With `dedup` enabled, exact and near-duplicate comments (spam floods,
+    copy-pastes differing only by emoji or whitespace) are classified once and
+    the label is counted for every member of the cluster.
 
-                results.append(out)
-                if out["hope_hate"].lower() == "hope":
-                    hope_count += 1
-                else:
-                    hate_count += 1
+    Results are aggregated in constant memory (counts, emotion histogram,
+    score statistics and top-k exemplars); the full per-comment list is only
+    returned under "results" when `keep_results` is set.
 
-            nextPageToken = response.get("nextPageToken")
-            if not nextPageToken:
-                print("--- Reached end of comments ---")
-                break
+    With `persist` enabled, every comment's prediction is also stored in the
+    comment_predictions table in large batches so it can be searched later.
+    `quota` is an optional QuotaBudget charged for every API page.
 
-    except googleapiclient.errors.HttpError as e:
+    With `sharded` (default: the SHARDED_ANALYSIS environment variable), each
+    comment page becomes a work unit on the shared work queue and is classified
+    by whichever worker processes are pulling from it; see `services.sharding`.
+    Near-duplicates are then collapsed within a page rather than across the
+    whole video. `keep_results` needs every row in this process, so it always
+    runs locally.
+    """
+    if sharded is None:
+        sharded = SHARDED_ANALYSIS
+    if sharded and not keep_results:
+        from services.sharding import analyze_sharded
+        return analyze_sharded(video_id, dedup=dedup, persist=persist, quota=quota)
+
+    stream = iter_comment_predictions(video_id, dedup=dedup, quota=quota)
+    from googleapiclient.errors import HttpError
+    aggregator = CommentAggregator(keep_results=keep_results)
+    pending_rows = []
+
+    def _flush_rows():
+        if pending_rows:
+            try:
+                add_comment_predictions(video_id, pending_rows)
+            except Exception as e:
+                print(f"❌ Could not store comment predictions: {e}")
+            del pending_rows[:]
+
+    def _summary(**extra):
+        summary = aggregator.summary()
+        summary["duplicates_collapsed"] = stream.duplicates_collapsed
+        summary.update(extra)
+        return summary
+
+    print(f"\n--- Starting Comment Analysis for Video ID: {video_id} ---")
+    try:
+        for out in stream:
+            # Duplicates count towards the totals but not the exemplars.
+            aggregator.add(out, exemplar="duplicate_of" not in out)
+            if persist:
+                pending_rows.append(out)
+                if len(pending_rows) >= PERSIST_BATCH_SIZE:
+                    _flush_rows()
+
+            print(f"Comment: {out['text'][:70]}...") # Print first 70 chars of comment
+            print(f"Prediction: {out}") # Print the prediction result
+
+            if aggregator.comments_processed % 20 == 0:
+                print(f"...processed {aggregator.comments_processed} comments")
+
+    except QuotaExceeded as e:
+        error_message = str(e)
+        print(f"\n❌ {error_message}")
+        _flush_rows()
+        return _summary(error=error_message, quota_exhausted=True)
+    except HttpError as e:
         error_message = f"An API error occurred: {e}. This could be due to an invalid API key, disabled API, or an invalid Video ID."
         print(f"\n❌ {error_message}")
         # Return what we have so far, along with the error
-        return {
-            "error": error_message,
-            "hope_count": hope_count,
-            "hate_count": hate_count,
-            "comments_processed": comments_processed,
-            "results": results
-        }
+        _flush_rows()
+        return _summary(error=error_message)
     except Exception as e:
         error_message = f"An unexpected error occurred: {e}"
         print(f"\n❌ {error_message}")
-        return {
-            "error": error_message,
-            "hope_count": hope_count,
-            "hate_count": hate_count,
-            "comments_processed": comments_processed,
-            "results": results
-        }
+        _flush_rows()
+        return _summary(error=error_message)
+
+    _flush_rows()
 
     print("\n--- Analysis Complete ---")
-    print(f"Total Comments Processed: {comments_processed}")
-    print(f"Hope Count: {hope_count}")
-    print(f"Hate Count: {hate_count}\n")
+    print(f"Total Comments Processed: {aggregator.comments_processed}")
+    print(f"Hope Count: {aggregator.hope_count}")
+    print(f"Hate Count: {aggregator.hate_count}")
+    if stream.deduplicator:
+        print(f"Duplicates Collapsed: {stream.duplicates_collapsed}")
+    print()
     
-    return {
-        "hope_count": hope_count,
-        "hate_count": hate_count,
-        "comments_processed": comments_processed,
-        "results": results
-    }
+    return _summary()
@@ -1,10 +1,7 @@
 
 # services/youtube_tracker.py
-import matplotlib
-matplotlib.use('Agg')
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+# pandas and matplotlib are imported inside plot_data so that importing this
+# module (and therefore app.py) does not pay for them on every worker boot.
 import time
 import csv
 import os
@@ -12,7 +9,6 @@ from datetime import datetime
 import pytz
 import random
 import traceback
-from googleapiclient.discovery import build
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,6 +18,11 @@ TIMEZONE = "Asia/Kolkata"
 PLOT_DIR = os.path.join("static", "images", "tracker")
 DATA_DIR = os.path.join("instance", "tracker_data")
 API_KEY = os.getenv("YOUTUBE_API_KEY")
+SERIES_COLUMNS = ['views', 'likes', 'subscribers']
+PLOT_SIZE = (10, 5)
+PLOT_DPI = 100
+MARKER_MAX_POINTS = 60
+ROLLUP_MAX_BUCKETS = 500
 # ---------------------------------------
 
 def get_youtube_service():
@@ -30,6 +31,7 @@ def get_youtube_service():
         print("YOUTUBE_API_KEY not found in .env file.")
         return None
     try:
+        from googleapiclient.discovery import build
         return build('youtube', 'v3', developerKey=API_KEY)
     except Exception as e:
         print("Error creating YouTube service:", e)
@@ -86,26 +88,58 @@ def append_row(path, ts_unix, iso, views, likes, subs):
                          likes if likes is not None else "",
                          subs if subs is not None else ""])
 
-def plot_data(csv_path, video_id, interval_min):
-    """Generates and saves plots for views, likes, and subscribers."""
+def load_series(csv_path):
+    """
+    Reads a tracker CSV into a time-sorted DataFrame with numeric, forward-filled
+    views/likes/subscribers and per-minute velocity columns. Returns None if the
+    file is missing or has fewer than two samples.
+    """
+    import pandas as pd
+    from services.downsample import add_velocity
+
     if not os.path.exists(csv_path):
         print(f"CSV file not found: {csv_path}")
-        return []
+        return None
 
     df = pd.read_csv(csv_path)
     if 'iso' not in df.columns or len(df) < 2:
         print("Not enough data to plot.")
-        return []
+        return None
 
     df['iso_dt'] = pd.to_datetime(df['iso'])
-    df = df.sort_values('iso_dt')
-    df['views'] = pd.to_numeric(df['views'], errors='coerce').fillna(method='ffill')
-    df['likes'] = pd.to_numeric(df['likes'], errors='coerce').fillna(method='ffill')
-    df['subscribers'] = pd.to_numeric(df['subscribers'], errors='coerce').fillna(method='ffill')
+    df = df.sort_values('iso_dt').reset_index(drop=True)
+    for column in SERIES_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce').ffill()
+    return add_velocity(df, 'iso_dt', SERIES_COLUMNS)
+
+def plot_data(csv_path, video_id, interval_min):
+    """Generates and saves plots for views, likes, and subscribers."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    from services.downsample import target_points, downsample_frame
+
+    df = load_series(csv_path)
+    if df is None:
+        return []
 
     tz = pytz.timezone(TIMEZONE)
-    locator = mdates.MinuteLocator(interval=max(1, int(interval_min / 5)))
-    formatter = mdates.DateFormatter('%H:%M', tz=tz)
+    time_range = df['iso_dt'].iloc[-1] - df['iso_dt'].iloc[0]
+    if time_range <= pd.Timedelta(hours=2):
+        locator = mdates.MinuteLocator(interval=max(1, int(interval_min / 5)))
+        formatter = mdates.DateFormatter('%H:%M', tz=tz)
+    else:
+        # Long runs would otherwise generate thousands of minute ticks.
+        locator = mdates.AutoDateLocator(tz=tz, maxticks=12)
+        formatter = mdates.DateFormatter('%d %b %H:%M', tz=tz)
+
+    # Never draw more points than the figure has room for.
+    n_points = target_points(
+        PLOT_SIZE[0] * PLOT_DPI, len(df),
+        time_range=time_range, sample_interval=pd.Timedelta(minutes=max(interval_min, 1e-3))
+    )
     
     plot_files = []
     plot_configs = [
@@ -115,8 +149,11 @@ def plot_data(csv_path, video_id, interval_min):
     ]
 
     for column, title, color in plot_configs:
-        fig, ax = plt.subplots(figsize=(10, 5))
-        ax.plot(df['iso_dt'], df[column], marker='o', linestyle='-', label=title, color=color)
+        plot_df = downsample_frame(df, 'iso_dt', column, n_points)
+        marker = 'o' if len(plot_df) <= MARKER_MAX_POINTS else None
+
+        fig, ax = plt.subplots(figsize=PLOT_SIZE, dpi=PLOT_DPI)
+        ax.plot(plot_df['iso_dt'], plot_df[column], marker=marker, linestyle='-', label=title, color=color)
         ax.set_xlabel(f'Time ({TIMEZONE})')
         ax.set_ylabel('Count')
         ax.set_title(f'{title} over Time for video {video_id}')
@@ -140,6 +177,26 @@ def plot_data(csv_path, video_id, interval_min):
 
     return plot_files
 
+def save_rollup(csv_path, max_buckets=ROLLUP_MAX_BUCKETS):
+    """
+    Stores min/max/mean per time bucket (values and per-minute velocity) next
+    to the raw CSV, so long tracking runs can be kept without every sample.
+    Returns the rollup path, or None if there was nothing to roll up.
+    """
+    from services.downsample import rollup_bucket, rollup
+
+    df = load_series(csv_path)
+    if df is None:
+        return None
+
+    bucket = rollup_bucket(df['iso_dt'].iloc[-1] - df['iso_dt'].iloc[0], max_buckets)
+    columns = SERIES_COLUMNS + [f"{column}_per_min" for column in SERIES_COLUMNS]
+    rolled = rollup(df, 'iso_dt', columns, bucket)
+
+    rollup_path = csv_path[:-len('.csv')] + f"_rollup_{bucket}.csv"
+    rolled.to_csv(rollup_path, index=False)
+    return rollup_path
+
 def track_video_stats(video_id, interval_min=1, samples=5):
     """
     Main function to track video stats and generate plots.
@@ -177,8 +234,13 @@ def track_video_stats(video_id, interval_min=1, samples=5):
             time.sleep(interval_min * 60)
 
     plot_files = plot_data(csv_filepath, video_id, interval_min)
+
+    try:
+        save_rollup(csv_filepath)
+    except Exception as e:
+        print(f"Could not store rollup for {csv_filepath}: {e}")
     
-    # Clean up the CSV file after generating plots
+    # Clean up the raw CSV file after generating plots and the rollup
     try:
         os.remove(csv_filepath)
     except OSError as e: